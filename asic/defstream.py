@@ -0,0 +1,168 @@
+# Streaming DEF reader shared by importpins and the fixdef tool.
+#
+# A DEF file is read as a sequence of statements. A statement is everything
+# up to the next ";" token, or a single "END ..." line. Every statement keeps
+# its original lines, so a tool can copy the file through unchanged and only
+# rewrite the statements it cares about. Only one statement is held in
+# memory at a time.
+
+# Statement kinds
+OTHER = 0    # outside of any section (header, DIEAREA, ROW, ...)
+START = 1    # section start, e.g. "PINS 10 ;"
+ITEM = 2     # "- ..." statement inside a section
+END = 3      # section end, e.g. "END PINS"
+
+# Sections that hold a list of "- ..." items and end with "END <name>"
+SECTIONS = {"PROPERTYDEFINITIONS", "VIAS", "STYLES", "NONDEFAULTRULES",
+        "REGIONS", "COMPONENTMASKSHIFT", "COMPONENTS", "PINS", "PINPROPERTIES",
+        "BLOCKAGES", "SLOTS", "FILLS", "SPECIALNETS", "NETS", "SCANCHAINS",
+        "GROUPS"}
+
+class Statement:
+    __slots__ = ("kind", "section", "tokens", "lines")
+
+    def __init__(self, kind, section, tokens, lines):
+        self.kind = kind
+        # Name of the section the statement belongs to, None outside
+        self.section = section
+        # Tokens without the final ";"
+        self.tokens = tokens
+        self.lines = lines
+
+    def text(self):
+        return "".join(self.lines)
+
+    def count(self):
+        """Item count of a section START statement"""
+        return int(self.tokens[1]) if len(self.tokens) > 1 else 0
+
+def statements(f):
+    """Yields the Statements of DEF file f, an iterable of lines"""
+    section = None
+    tokens = []
+    lines = []
+    for line in f:
+        la = line.split()
+        lines.append(line)
+        if not tokens:
+            if not la or la[0].startswith("#"):
+                # Blank line or comment
+                yield Statement(OTHER, section, [], lines)
+                lines = []
+                continue
+            if la[0] == "END":
+                # END lines have no ";"
+                yield Statement(END, section, la, lines)
+                if (section is not None) and (la[1:2] == [section]):
+                    section = None
+                lines = []
+                continue
+        for token in la:
+            if token != ";":
+                tokens.append(token)
+                continue
+            if section is not None:
+                kind = ITEM
+            elif tokens[0] in SECTIONS:
+                kind = START
+                section = tokens[0]
+            else:
+                kind = OTHER
+            yield Statement(kind, section, tokens, lines)
+            # Anything after ";" on the same line starts the next statement,
+            # the line itself was already passed with the previous one
+            tokens = []
+            lines = []
+    if lines:
+        yield Statement(OTHER, section, tokens, lines)
+
+class DefPin:
+    __slots__ = ("name", "net", "direction", "use", "layer", "rect",
+            "status", "x", "y", "orient")
+
+    def __init__(self):
+        self.name = ""
+        self.net = ""
+        self.direction = ""
+        self.use = ""
+        self.layer = ""
+        # (x1, y1, x2, y2) relative to the placement point
+        self.rect = (0, 0, 0, 0)
+        # PLACED, FIXED or COVER, empty if unplaced
+        self.status = ""
+        self.x = 0
+        self.y = 0
+        self.orient = ""
+
+    @property
+    def w(self):
+        return abs(self.rect[2] - self.rect[0])
+
+    @property
+    def h(self):
+        return abs(self.rect[3] - self.rect[1])
+
+def parse_pin(tokens):
+    """Parses the tokens of a PINS item, only the first port is used"""
+    pin = DefPin()
+    pin.name = tokens[1]
+    i = 2
+    n = len(tokens)
+    while i < n:
+        if tokens[i] != "+":
+            i = i + 1
+            continue
+        key = tokens[i + 1]
+        if key == "NET":
+            pin.net = tokens[i + 2]
+        elif key == "DIRECTION":
+            pin.direction = tokens[i + 2]
+        elif key == "USE":
+            pin.use = tokens[i + 2]
+        elif (key == "LAYER") and not pin.layer:
+            pin.layer = tokens[i + 2]
+            # Optional MASK/SPACING/DESIGNRULEWIDTH before the rectangle
+            j = tokens.index("(", i)
+            pin.rect = (int(tokens[j + 1]), int(tokens[j + 2]),
+                    int(tokens[j + 5]), int(tokens[j + 6]))
+        elif (key in ("PLACED", "FIXED", "COVER")) and not pin.status:
+            pin.status = key
+            pin.x = int(tokens[i + 3])
+            pin.y = int(tokens[i + 4])
+            pin.orient = tokens[i + 6]
+        i = i + 2
+    return pin
+
+def read_pins(f):
+    """Yields the DefPin of every pin, stops reading after END PINS"""
+    for statement in statements(f):
+        if statement.section != "PINS":
+            continue
+        if statement.kind == ITEM:
+            yield parse_pin(statement.tokens)
+        elif statement.kind == END:
+            return
+
+class Writer:
+    """Output file with bulk writes, statements are joined into large blocks"""
+
+    def __init__(self, f, block_size=1 << 20):
+        self.f = f
+        self.block_size = block_size
+        self.chunks = []
+        self.size = 0
+
+    def write(self, text):
+        self.chunks.append(text)
+        self.size = self.size + len(text)
+        if self.size >= self.block_size:
+            self.flush()
+
+    def write_statement(self, statement):
+        for line in statement.lines:
+            self.write(line)
+
+    def flush(self):
+        self.f.write("".join(self.chunks))
+        self.chunks = []
+        self.size = 0
@@ -1,17 +1,11 @@
 from siliconcompiler.core import Chip
 from siliconcompiler.floorplan import Floorplan
 from importpins import import_pins_from_lef, load_lef
+from placement import PlacementModel, core_area, load_table, ram_halo, ram_origin, snap
+from placement import TOP_W, TOP_H, ANALOG_Y
 
 import math
 
-# Fixed user wrapper size 2.92mm x 3.52mm
-TOP_W = 2920
-TOP_H = 3520
-MARGIN_W = 15
-MARGIN_H = 15
-
-ANALOG_Y = 2900
-
 RAM_8_1024 = "sky130_sram_1kbyte_1rw1r_8x1024_8"
 RAM_24_128 = "sky130_sram_1r1w_24x128"
 RAM_32_256 = "sky130_sram_1kbyte_1rw1r_32x256_8"
@@ -19,6 +13,9 @@ RAM_32_512 = "sky130_sram_2kbyte_1rw1r_32x512_8"
 RAM_46_128 = "sky130_sram_1r1w_46x128"
 RAM_64_512 = "sky130_sram_4kbyte_1r1w_64x512"
 
+# RAM placement table, can be generated by ramplace.py
+RAM_TABLE = "ram_placement.json"
+
 def configure_chip(design):
     chip = Chip(design)
     chip.load_target("skywater130_demo")
@@ -39,16 +36,10 @@ def load_lib(chip):
     chip.add("asic", "macrolib", "analog_area")
 
 def define_dimensions(fp):
-    margin_left = snap_x(fp, MARGIN_W, 1)
-    margin_bottom = snap_y(fp, MARGIN_H, 1)
-    #margin_left = 0
-    #margin_bottom = 0
+    (place_w, place_h), (margin_left, margin_bottom) = core_area(
+            fp.stdcell_width, fp.stdcell_height)
     core_w = TOP_W
     core_h = TOP_H
-    place_w = snap_x(fp, core_w - MARGIN_W * 2, 0)
-    place_h = snap_y(fp, core_h - MARGIN_H * 2, 0)
-    #place_w = TOP_W
-    #place_h = TOP_H
 
     return (core_w, core_h), (place_w, place_h), (margin_left, margin_bottom)
 
@@ -61,32 +52,25 @@ def core_setup_area(fp, chip):
     chip.add("asic", "corearea", (place_w + margin_left, place_h + margin_bottom))
 
 def snap_x(fp, val, adj):
-    return (round(val / fp.stdcell_width) + adj) * fp.stdcell_width
+    return snap(val, fp.stdcell_width, adj)
 
 def snap_y(fp, val, adj):
-    return (round(val / fp.stdcell_height) + adj) * fp.stdcell_height
-
-def place_ram(fp, inst_name, macro_name, x, y, orientation, cut_left = False, cut_right = False):
-    dims = define_dimensions(fp)
-    _, _, (margin_left, margin_bottom) = dims
+    return snap(val, fp.stdcell_height, adj)
 
+def place_ram(fp, model, inst_name, macro_name, x, y, orientation, cut_left = False, cut_right = False):
     ## Place RAM macro ##
     ram_w = fp.available_cells[macro_name].width
     ram_h = fp.available_cells[macro_name].height
     print("Macro", macro_name, "W", ram_w, "H", ram_h)
-    ram_x = x * fp.stdcell_width + margin_left
-    # Add hand-calculated fudge factor to align left-side pins with routing tracks.
-    ram_y = y * fp.stdcell_height + margin_bottom + 0.53
+    ram_x, ram_y = ram_origin(x, y, fp.stdcell_width, fp.stdcell_height)
 
     fp.place_macros([(inst_name, macro_name)], ram_x, ram_y, 0, 0, orientation, snap=False)
 
-    ram_halo_w = 40
-    ram_halo_h = 20
-    halo_x = snap_x(fp, ram_x - ram_halo_w, -1)
-    halo_y = snap_y(fp, ram_y - ram_halo_h, -1)
-    halo_w = snap_x(fp, ram_x + ram_w + ram_halo_w, 0) - halo_x
-    halo_h = snap_y(fp, ram_y + ram_h + ram_halo_h, 0) - halo_y
+    halo_x, halo_y, halo_w, halo_h = ram_halo(ram_x, ram_y, ram_w, ram_h,
+            fp.stdcell_width, fp.stdcell_height)
     fp.place_blockage(halo_x, halo_y, halo_w, halo_h, layer="li1")
+    model.add_macro(inst_name, ram_x, ram_y, ram_w, ram_h,
+            (halo_x, halo_y, halo_w, halo_h))
 
     ram_margin_x = 100 * fp.stdcell_width
     ram_margin_y = 20 * fp.stdcell_height
@@ -98,15 +82,15 @@ def place_ram(fp, inst_name, macro_name, x, y, orientation, cut_left = False, cu
     fp.place_blockage(blockage_x, blockage_y, blockage_w, blockage_h)
 
     if cut_right or cut_left:
-        for row in fp.rows:
-            if (row["y"] > (halo_y - 0.001)) and (row["y"] < (halo_y + halo_h + 0.001)):
-                if cut_right:
-                    row["numx"] = round(halo_x / row["stepx"])
-                if cut_left:
-                    oldx = row["x"]
-                    row["x"] = halo_x + halo_w
-                    diffx = row["x"] - oldx
-                    row["numx"] = row["numx"] - round(diffx / row["stepx"])
+        for row in model.rows.between(halo_y, halo_y + halo_h):
+            if cut_right:
+                row["numx"] = round(halo_x / row["stepx"])
+            if cut_left:
+                oldx = row["x"]
+                row["x"] = halo_x + halo_w
+                diffx = row["x"] - oldx
+                row["numx"] = row["numx"] - round(diffx / row["stepx"])
+
 def place_pin(fp, name, x, y, w, h, layer, use = "SIGNAL", fixed = False, drawing = False):
     fp.place_pins([name], x, y, 0, 0, w, h, layer,
             use = use,
@@ -116,7 +100,9 @@ def place_pin(fp, name, x, y, w, h, layer, use = "SIGNAL", fixed = False, drawin
         fp.add_net(name, [name], use)
         fp.place_wires([name], x, y, 0, 0, w, h, layer)
 
-def place_blockage_all_layers(fp, x, y, w, h):
+def place_blockage_all_layers(fp, x, y, w, h, model = None):
+    if model is not None:
+        model.add_keepout("blockage", x, y, w, h)
     fp.place_blockage(x, y, w, h, layer="li1")
     fp.place_blockage(x, y, w, h, layer="met1")
     fp.place_blockage(x, y, w, h, layer="met2")
@@ -134,6 +120,8 @@ def core_floorplan(fp):
     diearea = [(0, 0), (core_w, core_h)]
     corearea = [(margin_left, margin_bottom), (place_w + margin_left, place_h + margin_bottom)]
     fp.create_diearea(diearea, corearea=corearea)
+    # Checks the macros against each other and the keep-out regions
+    model = PlacementModel(fp.rows, corearea)
 
     # Don"t use user_analog_project_wrapper.def, it"s broken as of MPW-7
     #import_pins_from_def(fp, "user_analog_project_wrapper.def")
@@ -144,28 +132,14 @@ def core_floorplan(fp):
                 pin["w"] / 1000, pin["h"] / 1000, pin["layer"], pin["use"],
                 fixed = False, drawing = not pin_fitler(pin["name"]))
 
-    # not gonna to calculate, just going to place wherever I like
-    place_ram(fp, "asictop.risu.l1d.cache_ram\[0\].cache_data.hi_mem", RAM_32_512, 4570, 220, "N", cut_right = True)
-    place_ram(fp, "asictop.risu.l1d.cache_ram\[0\].cache_data.lo_mem", RAM_32_512, 4570, 440, "N", cut_right = True)
-    place_ram(fp, "asictop.risu.l1d.cache_ram\[1\].cache_data.hi_mem", RAM_32_512, 4570, 660, "N", cut_right = True)
-    place_ram(fp, "asictop.risu.l1d.cache_ram\[1\].cache_data.lo_mem", RAM_32_512, 4570, 880, "N", cut_right = True)
-
-    place_ram(fp, "asictop.risu.l1i.cache_ram\[0\].cache_data.hi_mem", RAM_32_512, 2910, 220, "N")
-    place_ram(fp, "asictop.risu.l1i.cache_ram\[0\].cache_data.lo_mem", RAM_32_512, 2910, 440, "N")
-    place_ram(fp, "asictop.risu.l1i.cache_ram\[1\].cache_data.hi_mem", RAM_32_512, 2910, 660, "N")
-    place_ram(fp, "asictop.risu.l1i.cache_ram\[1\].cache_data.lo_mem", RAM_32_512, 2910, 880, "N")
-
-    place_ram(fp, "asictop.risu.l1d.cache_ram\[0\].cache_meta.mem", RAM_32_256, 3940, 20, "N")
-    place_ram(fp, "asictop.risu.l1d.cache_ram\[1\].cache_meta.mem", RAM_32_256, 5150, 20, "N", cut_right = True)
-
-    place_ram(fp, "asictop.risu.l1i.cache_ram\[0\].cache_meta.mem", RAM_32_256, 1520, 20, "N")
-    place_ram(fp, "asictop.risu.l1i.cache_ram\[1\].cache_meta.mem", RAM_32_256, 2730, 20, "N")
-
-    place_ram(fp, "asictop.risu.cpu.ifp.bp.bpu_ram.mem", RAM_8_1024, 260, 540, "N", cut_left = True)
+    for ram in load_table(RAM_TABLE):
+        place_ram(fp, model, ram["inst"], ram["macro"], ram["x"], ram["y"],
+                ram["orient"], cut_left = ram["cut_left"],
+                cut_right = ram["cut_right"])
 
     # Allow routing in right most 100 microns
-    place_blockage_all_layers(fp, 0, ANALOG_Y, TOP_W - 100, TOP_H - ANALOG_Y)
-    place_blockage_all_layers(fp, TOP_W - 100, 3000, 100, TOP_H - 3000)
+    place_blockage_all_layers(fp, 0, ANALOG_Y, TOP_W - 100, TOP_H - ANALOG_Y, model)
+    place_blockage_all_layers(fp, TOP_W - 100, 3000, 100, TOP_H - 3000, model)
     fp.place_blockage(TOP_W - 100, ANALOG_Y, 100, 3000 - ANALOG_Y, layer="met4")
     fp.place_blockage(TOP_W - 100, ANALOG_Y, 100, 3000 - ANALOG_Y, layer="met5")
     fp.place_blockage(TOP_W - 100, ANALOG_Y, 100, 100, layer="met3")
@@ -173,6 +147,10 @@ def core_floorplan(fp):
     # Place analog area as an macro
     #fp.place_macros([("analog_area", "analog_area")], 0, 0, 0, 0, "N", snap=False)
     fp.place_macros([("analog_area", "analog_area")], 0, ANALOG_Y, 0, 0, "N", snap=False)
+    analog = fp.available_cells["analog_area"]
+    model.add_macro("analog_area", 0, ANALOG_Y, analog.width, analog.height,
+            fixed = True)
+    model.check()
 
     # Manually connect power supplies
     fp.add_net("vccd1", ["vccd1"], "power")
@@ -1,111 +1,45 @@
 from siliconcompiler.core import Chip
 from siliconcompiler.floorplan import Floorplan
 
+import defstream
+import lefdb
+
 def load_def(fn):
     pins = []
     with open(fn) as f:
-        in_pins = False
-        pin_name = ""
-        pin_net = ""
-        pin_dir = ""
-        pin_use = ""
-        pin_layer = ""
-        pin_ori = ""
-        pin_fixed = False
-        pin_x = 0
-        pin_y = 0
-        pin_w = 0
-        pin_h = 0
-        for l in f:
-            if not in_pins:
-                if l.strip().startswith("PINS"):
-                    in_pins = True
-            else:
-                la = l.strip().split()
-                if l.strip().startswith("END PINS"):
-                    in_pins = False
-                elif l.strip().startswith("-"):
-                    pin_name = la[1]
-                    pin_net = la[4]
-                    pin_dir = la[7]
-                    pin_use = la[10]
-                elif ("LAYER" in l):
-                    pin_layer = la[2]
-                    pin_w = abs(int(la[8]) - int(la[4]))
-                    pin_h = abs(int(la[9]) - int(la[5]))
-                elif ("PLACED" in l) or ("FIXED" in l):
-                    pin_x = int(la[3])
-                    pin_y = int(la[4])
-                    pin_x = pin_x - pin_w / 2
-                    pin_y = pin_y - pin_h / 2
-                    pin_ori = la[6]
-                    pin_fixed = la[1] == "FIXED"
-                    pin = {
-                            "name": pin_name,
-                            "layer": pin_layer,
-                            "net": pin_net,
-                            "net": pin_name,
-                            "dir": pin_dir,
-                            "use": pin_use,
-                            "ori": pin_ori,
-                            "fixed": pin_fixed,
-                            "x": pin_x,
-                            "y": pin_y,
-                            "w": pin_w,
-                            "h": pin_h}
-                    pins.append(pin)
+        for pin in defstream.read_pins(f):
+            if not pin.status:
+                continue
+            pins.append({
+                    "name": pin.name,
+                    "layer": pin.layer,
+                    "net": pin.net,
+                    "dir": pin.direction,
+                    "use": pin.use,
+                    "ori": pin.orient,
+                    "fixed": pin.status == "FIXED",
+                    "x": pin.x - pin.w / 2,
+                    "y": pin.y - pin.h / 2,
+                    "w": pin.w,
+                    "h": pin.h})
     return pins
 
 def load_lef(fn):
     pins = []
-    with open(fn) as f:
-        in_pin = False
-        pin_name = ""
-        pin_dir = ""
-        pin_use = ""
-        pin_layer = ""
-        pin_x = 0
-        pin_y = 0
-        pin_w = 0
-        pin_h = 0
-        for l in f:
-            la = l.strip().split()
-            if not in_pin:
-                if (len(la) != 0) and (la[0] == "PIN"):
-                    in_pin = True
-                    pin_name = la[1]
-            else:
-                if la[0] == "DIRECTION":
-                    pin_dir = la[1]
-                elif la[0] == "USE":
-                    pin_use = la[1]
-                elif la[0] == "LAYER":
-                    pin_layer = la[1]
-                elif la[0] == "RECT":
-                    x1 = float(la[1])
-                    y1 = float(la[2])
-                    x2 = float(la[3])
-                    y2 = float(la[4])
-                    pin_x = round(x1 * 1000)
-                    pin_y = round(y1 * 1000)
-                    pin_w = round((x2 - x1) * 1000)
-                    pin_h = round((y2 - y1) * 1000)
-                elif la[0] == "END":
-                    in_pin = False
-                    pin = {
-                            "name": pin_name,
-                            "layer": pin_layer,
-                            "net": pin_name,
-                            "net": pin_name,
-                            "dir": pin_dir,
-                            "use": pin_use,
-                            "ori": "N",
-                            "fixed": False,
-                            "x": pin_x,
-                            "y": pin_y,
-                            "w": pin_w,
-                            "h": pin_h}
-                    pins.append(pin)
+    for macro in lefdb.load(fn).values():
+        for pin in macro.pins:
+            pins.append({
+                    "name": pin.name,
+                    "layer": pin.layer,
+                    "net": pin.name,
+                    "dir": pin.direction,
+                    "use": pin.use,
+                    "ori": "N",
+                    "fixed": False,
+                    "x": pin.x,
+                    "y": pin.y,
+                    "w": pin.w,
+                    "h": pin.h})
     return pins
 
 def place_pins(pins, fp):
@@ -0,0 +1,230 @@
+# Parsed LEF macro database used by importpins and floorplan.
+#
+# A LEF file is parsed once into LefMacro/LefPin objects with all
+# coordinates in nm (integers). The result is pickled next to the LEF as
+# <file>.lefdb together with the sha256 of the LEF, so later runs only hash
+# the file instead of parsing it again. Within one process a file is only
+# loaded once.
+import hashlib
+import os
+import pickle
+
+CACHE_MAGIC = b"LEFDB\x00\x00\x01"
+CACHE_SUFFIX = ".lefdb"
+
+# SRAM macro LEFs, relative to the asic directory as in libs/sky130sram_*.py
+SRAM_LEF_DIR = "sky130/ram"
+
+# Pin sides, from the edge of the macro the pin touches
+NORTH = "N"
+SOUTH = "S"
+EAST = "E"
+WEST = "W"
+
+_loaded = {}
+
+def to_nm(val):
+    return round(float(val) * 1000)
+
+class LefPin:
+    __slots__ = ("name", "direction", "use", "shapes", "side")
+
+    def __init__(self, name):
+        self.name = name
+        self.direction = ""
+        self.use = ""
+        # (layer, x1, y1, x2, y2) of every port rectangle
+        self.shapes = []
+        # NORTH/SOUTH/EAST/WEST, None if not on the macro boundary
+        self.side = None
+
+    # Like the old importpins.load_lef, the last rectangle is the pin shape
+    @property
+    def layer(self):
+        return self.shapes[-1][0] if self.shapes else ""
+
+    @property
+    def rect(self):
+        return self.shapes[-1][1:] if self.shapes else (0, 0, 0, 0)
+
+    @property
+    def x(self):
+        return self.rect[0]
+
+    @property
+    def y(self):
+        return self.rect[1]
+
+    @property
+    def w(self):
+        return self.rect[2] - self.rect[0]
+
+    @property
+    def h(self):
+        return self.rect[3] - self.rect[1]
+
+class LefMacro:
+    __slots__ = ("name", "cls", "width", "height", "pins", "by_name",
+            "by_layer", "by_side")
+
+    def __init__(self, name):
+        self.name = name
+        self.cls = ""
+        # Size in nm
+        self.width = 0
+        self.height = 0
+        # In file order. A name may appear more than once (split power pins).
+        self.pins = []
+        self.by_name = {}
+        self.by_layer = {}
+        self.by_side = {}
+
+    def index(self):
+        """Assigns pin sides and builds the lookup tables"""
+        self.by_name = {}
+        self.by_layer = {}
+        self.by_side = {}
+        for pin in self.pins:
+            pin.side = pin_side(pin, self.width, self.height)
+            self.by_name.setdefault(pin.name, []).append(pin)
+            self.by_layer.setdefault(pin.layer, []).append(pin)
+            self.by_side.setdefault(pin.side, []).append(pin)
+
+    def pin(self, name):
+        """Returns the first pin called name, None if there is none"""
+        pins = self.by_name.get(name)
+        return pins[0] if pins else None
+
+    def pins_named(self, name):
+        return self.by_name.get(name, [])
+
+    def pins_on_layer(self, layer):
+        return self.by_layer.get(layer, [])
+
+    def pins_on_side(self, side):
+        return self.by_side.get(side, [])
+
+def pin_side(pin, width, height):
+    if not pin.shapes:
+        return None
+    x1, y1, x2, y2 = pin.rect
+    if x1 <= 0:
+        return WEST
+    if x2 >= width:
+        return EAST
+    if y1 <= 0:
+        return SOUTH
+    if y2 >= height:
+        return NORTH
+    return None
+
+def parse(f):
+    """Returns the macros of LEF file f, an iterable of lines, by name"""
+    macros = {}
+    macro = None
+    pin = None
+    layer = ""
+    # Name of the open block inside a macro: PIN, PORT or OBS
+    block = []
+    for line in f:
+        la = line.split()
+        if (not la) or la[0].startswith("#"):
+            continue
+        key = la[0]
+        if macro is None:
+            if key == "MACRO":
+                macro = LefMacro(la[1])
+            continue
+        if key == "END":
+            if block:
+                if block.pop() == "PIN":
+                    macro.pins.append(pin)
+                    pin = None
+            else:
+                macro.index()
+                macros[macro.name] = macro
+                macro = None
+        elif key in ("PORT", "OBS"):
+            block.append(key)
+        elif key == "PIN":
+            block.append(key)
+            pin = LefPin(la[1])
+        elif block and (block[-1] == "OBS"):
+            continue
+        elif key == "LAYER":
+            layer = la[1]
+        elif key == "RECT":
+            # Optional "MASK n" before the coordinates
+            xy = [t for t in la[1:] if t != ";"][-4:]
+            x1, y1, x2, y2 = [to_nm(v) for v in xy]
+            pin.shapes.append((layer, min(x1, x2), min(y1, y2),
+                    max(x1, x2), max(y1, y2)))
+        elif pin is not None:
+            if key == "DIRECTION":
+                pin.direction = la[1]
+            elif key == "USE":
+                pin.use = la[1]
+        elif key == "CLASS":
+            macro.cls = la[1]
+        elif key == "SIZE":
+            macro.width = to_nm(la[1])
+            macro.height = to_nm(la[3])
+    return macros
+
+def cache_path(fn):
+    return fn + CACHE_SUFFIX
+
+def load_cache(fn, digest):
+    try:
+        with open(cache_path(fn), "rb") as f:
+            if f.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+                return None
+            if f.read(len(digest)) != digest:
+                return None
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+        return None
+
+def save_cache(fn, digest, macros):
+    path = cache_path(fn)
+    tmp = "%s.%d" % (path, os.getpid())
+    try:
+        with open(tmp, "wb") as f:
+            f.write(CACHE_MAGIC)
+            f.write(digest)
+            pickle.dump(macros, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+def load(fn, cache=True):
+    """Returns the macros of LEF file fn by name, through the cache"""
+    with open(fn, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data).digest()
+    key = os.path.abspath(fn)
+    if key in _loaded and _loaded[key][0] == digest:
+        return _loaded[key][1]
+    macros = load_cache(fn, digest) if cache else None
+    if macros is None:
+        macros = parse(data.decode().splitlines())
+        if cache:
+            save_cache(fn, digest, macros)
+    _loaded[key] = (digest, macros)
+    return macros
+
+def load_macro(fn, name=None, cache=True):
+    """Returns macro name of LEF file fn, or its only macro"""
+    macros = load(fn, cache)
+    if name is None:
+        if len(macros) != 1:
+            raise ValueError(f"{fn} has {len(macros)} macros")
+        return next(iter(macros.values()))
+    return macros[name]
+
+def sram_macro(name, cache=True):
+    """Returns the SRAM macro name, e.g. floorplan.RAM_32_512"""
+    return load_macro(os.path.join(SRAM_LEF_DIR, name + ".lef"), name, cache)
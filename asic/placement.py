@@ -0,0 +1,177 @@
+# Placement model for the core floorplan.
+#
+# Keeps the placed macros, their halos and the keep-out regions in sorted
+# indices so that overlaps can be checked while the floorplan is built,
+# instead of being found by OpenROAD hours later. All values are in um,
+# like the Floorplan API.
+import json
+from bisect import bisect_left, bisect_right
+
+# Fixed user wrapper size 2.92mm x 3.52mm
+TOP_W = 2920
+TOP_H = 3520
+MARGIN_W = 15
+MARGIN_H = 15
+
+ANALOG_Y = 2900
+
+# Standard cell free halo around RAM macros
+RAM_HALO_W = 40
+RAM_HALO_H = 20
+
+# Tolerance for touching edges, same as the row matching in place_ram
+EPS = 0.001
+
+def snap(val, step, adj):
+    return (round(val / step) + adj) * step
+
+def core_area(site_w, site_h):
+    """Returns (place_w, place_h), (margin_left, margin_bottom)"""
+    margin_left = snap(MARGIN_W, site_w, 1)
+    margin_bottom = snap(MARGIN_H, site_h, 1)
+    place_w = snap(TOP_W - MARGIN_W * 2, site_w, 0)
+    place_h = snap(TOP_H - MARGIN_H * 2, site_h, 0)
+    return (place_w, place_h), (margin_left, margin_bottom)
+
+def ram_origin(x, y, site_w, site_h):
+    """Returns the position of a RAM placed at site x of row y"""
+    _, (margin_left, margin_bottom) = core_area(site_w, site_h)
+    # Add hand-calculated fudge factor to align left-side pins with routing tracks.
+    return x * site_w + margin_left, y * site_h + margin_bottom + 0.53
+
+def ram_halo(ram_x, ram_y, ram_w, ram_h, site_w, site_h):
+    """Returns the halo (x, y, w, h) of a RAM, snapped to the site grid"""
+    halo_x = snap(ram_x - RAM_HALO_W, site_w, -1)
+    halo_y = snap(ram_y - RAM_HALO_H, site_h, -1)
+    halo_w = snap(ram_x + ram_w + RAM_HALO_W, site_w, 0) - halo_x
+    halo_h = snap(ram_y + ram_h + RAM_HALO_H, site_h, 0) - halo_y
+    return halo_x, halo_y, halo_w, halo_h
+
+def load_table(fn):
+    """
+    Returns the RAM placement table, a list of dicts with inst, macro, x
+    (in sites), y (in rows), orient, cut_left and cut_right
+    """
+    with open(fn) as f:
+        return json.load(f)
+
+def write_table(fn, table):
+    with open(fn, "w") as f:
+        json.dump(table, f, indent=4)
+        f.write("\n")
+
+class Rect:
+    __slots__ = ("name", "x1", "y1", "x2", "y2")
+
+    def __init__(self, name, x, y, w, h):
+        self.name = name
+        self.x1 = x
+        self.y1 = y
+        self.x2 = x + w
+        self.y2 = y + h
+
+    def overlaps(self, other):
+        return ((self.x1 < other.x2 - EPS) and (other.x1 < self.x2 - EPS) and
+                (self.y1 < other.y2 - EPS) and (other.y1 < self.y2 - EPS))
+
+    def inside(self, other):
+        return ((self.x1 > other.x1 - EPS) and (self.x2 < other.x2 + EPS) and
+                (self.y1 > other.y1 - EPS) and (self.y2 < other.y2 + EPS))
+
+    def __str__(self):
+        return "%s (%.2f, %.2f)-(%.2f, %.2f)" % (self.name, self.x1, self.y1,
+                self.x2, self.y2)
+
+class RectIndex:
+    """
+    Rectangles sorted by left edge. A query only visits the rectangles whose
+    left edge lies within the widest rectangle of the query window, found
+    by bisection, so it's O(log n + k) for similar sized macros.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.rects = []
+        self.max_w = 0
+
+    def __len__(self):
+        return len(self.rects)
+
+    def add(self, rect):
+        key = (rect.x1, len(self.rects))
+        i = bisect_right(self.keys, key)
+        self.keys.insert(i, key)
+        self.rects.insert(i, rect)
+        self.max_w = max(self.max_w, rect.x2 - rect.x1)
+
+    def query(self, rect):
+        """Returns the rectangles overlapping rect"""
+        lo = bisect_left(self.keys, (rect.x1 - self.max_w, -1))
+        hi = bisect_left(self.keys, (rect.x2, -1))
+        return [r for r in self.rects[lo:hi] if r.overlaps(rect)]
+
+class RowIndex:
+    """Standard cell rows of a Floorplan indexed by their y position"""
+
+    def __init__(self, rows):
+        self.rows = sorted(rows, key=lambda row: row["y"])
+        self.ys = [row["y"] for row in self.rows]
+
+    def between(self, y1, y2):
+        """Returns the rows with y1 <= y <= y2"""
+        lo = bisect_left(self.ys, y1 - EPS)
+        hi = bisect_right(self.ys, y2 + EPS)
+        return self.rows[lo:hi]
+
+class PlacementModel:
+    def __init__(self, rows, corearea):
+        self.rows = RowIndex(rows)
+        (x1, y1), (x2, y2) = corearea
+        self.core = Rect("core", x1, y1, x2 - x1, y2 - y1)
+        self.macros = RectIndex()
+        self.halos = RectIndex()
+        self.keepouts = RectIndex()
+        # Names of macros allowed outside of the core area and in keep-outs
+        self.fixed = set()
+        self.violations = []
+
+    def add_keepout(self, name, x, y, w, h):
+        keepout = Rect(name, x, y, w, h)
+        for macro in self.macros.query(keepout):
+            if macro.name not in self.fixed:
+                self.violations.append(f"{macro} is inside keep-out {keepout}")
+        self.keepouts.add(keepout)
+
+    def add_macro(self, name, x, y, w, h, halo=None, fixed=False):
+        """
+        Adds a macro and its halo, given as (x, y, w, h), and records any
+        violation it causes. A fixed macro, like the analog area, is only
+        checked against the other macros and their halos.
+        """
+        macro = Rect(name, x, y, w, h)
+        halo = Rect(name, *halo) if halo else macro
+        if fixed:
+            self.fixed.add(name)
+        elif not macro.inside(self.core):
+            self.violations.append(f"{macro} is outside of the core area")
+        overlaps = set()
+        for other in self.macros.query(macro):
+            self.violations.append(f"{macro} overlaps {other}")
+            overlaps.add(other.name)
+        for other in self.halos.query(macro):
+            if other.name not in overlaps:
+                self.violations.append(f"{macro} is inside the halo of {other.name}")
+        for other in self.macros.query(halo):
+            if not other.overlaps(macro):
+                self.violations.append(f"{other} is inside the halo of {name}")
+        if not fixed:
+            for keepout in self.keepouts.query(macro):
+                self.violations.append(f"{macro} is inside keep-out {keepout}")
+        self.macros.add(macro)
+        self.halos.add(halo)
+
+    def check(self):
+        """Raises ValueError listing every violation found so far"""
+        if self.violations:
+            raise ValueError("Illegal macro placement:\n  " +
+                    "\n  ".join(self.violations))
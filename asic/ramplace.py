@@ -0,0 +1,261 @@
+# SRAM macro placement by simulated annealing.
+#
+# Starts from the placement table used by core_floorplan (ram_placement.json)
+# and moves the RAMs to reduce an estimated wirelength:
+# - from the signal pins of every RAM to the core logic, taken as the centroid
+#   of the wrapper pins the core connects to
+# - between the RAMs of the same cache controller (half perimeter of their
+#   pins and the core logic)
+# Every RAM stays inside the core area with its halo below ANALOG_Y, and
+# outside of the halos of the other RAMs. Macro sizes and pins come from the
+# SRAM LEFs, the core pins from the wrapper LEF, both through lefdb.
+import argparse
+import math
+import random
+
+import lefdb
+from placement import (ANALOG_Y, TOP_H, TOP_W, PlacementModel, Rect,
+        core_area, load_table, ram_halo, ram_origin, write_table)
+
+WRAPPER_LEF = "user_analog_project_wrapper_empty.lef"
+RAM_TABLE = "ram_placement.json"
+
+# Wrapper pins used by asictop, see user_analog_project_wrapper.v
+CORE_PINS = ("io_in", "io_out", "io_oeb", "user_clock2", "wb_rst_i")
+
+# Rows between a halo and a core edge closer than this (um) are cut
+CUT_GAP = 150
+
+# sky130hd site size
+SITE_W = 0.46
+SITE_H = 2.72
+
+class Ram:
+    __slots__ = ("inst", "macro", "group", "w", "h", "pin_x", "pin_y",
+            "npins", "x", "y")
+
+    def __init__(self, entry):
+        if entry["orient"] != "N":
+            raise ValueError(f"{entry['inst']}: only N orientation is supported")
+        self.inst = entry["inst"]
+        self.macro = entry["macro"]
+        # The controller is the instance owning the RAM wrapper, e.g.
+        # asictop.risu.l1d for asictop.risu.l1d.cache_ram\[0\]...
+        path = self.inst.split(".")
+        for i, name in enumerate(path):
+            if "_ram" in name:
+                path = path[:i]
+                break
+        self.group = ".".join(path)
+        macro = lefdb.sram_macro(self.macro)
+        self.w = macro.width / 1000
+        self.h = macro.height / 1000
+        # Signal pin centroid relative to the macro origin
+        pins = [pin for pin in macro.pins if pin.use not in ("POWER", "GROUND")]
+        self.npins = len(pins)
+        self.pin_x = sum(pin.x + pin.w / 2 for pin in pins) / self.npins / 1000
+        self.pin_y = sum(pin.y + pin.h / 2 for pin in pins) / self.npins / 1000
+        self.x = entry["x"]
+        self.y = entry["y"]
+
+    def origin(self, x=None, y=None):
+        return ram_origin(self.x if x is None else x,
+                self.y if y is None else y, SITE_W, SITE_H)
+
+    def pins(self):
+        ram_x, ram_y = self.origin()
+        return ram_x + self.pin_x, ram_y + self.pin_y
+
+    def rect(self, x=None, y=None):
+        ram_x, ram_y = self.origin(x, y)
+        return Rect(self.inst, ram_x, ram_y, self.w, self.h)
+
+    def halo(self, x=None, y=None):
+        ram_x, ram_y = self.origin(x, y)
+        return Rect(self.inst, *ram_halo(ram_x, ram_y, self.w, self.h,
+                SITE_W, SITE_H))
+
+def core_anchor(fn):
+    wrapper = lefdb.load_macro(fn)
+    pins = [pin for pin in wrapper.pins if pin.name.split("[")[0] in CORE_PINS]
+    x = sum(pin.x + pin.w / 2 for pin in pins) / len(pins) / 1000
+    y = sum(pin.y + pin.h / 2 for pin in pins) / len(pins) / 1000
+    return x, y
+
+class Annealer:
+    def __init__(self, rams, anchor, seed):
+        self.rams = rams
+        self.anchor = anchor
+        self.random = random.Random(seed)
+        (place_w, place_h), (margin_left, margin_bottom) = core_area(SITE_W,
+                SITE_H)
+        self.core = Rect("core", margin_left, margin_bottom, place_w, place_h)
+        self.groups = {}
+        for ram in rams:
+            self.groups.setdefault(ram.group, []).append(ram)
+        self.macros = [ram.rect() for ram in rams]
+        self.halos = [ram.halo() for ram in rams]
+        for i, ram in enumerate(rams):
+            if not self.legal(i, ram.x, ram.y):
+                raise ValueError(f"{ram.inst}: initial placement is illegal")
+
+    def legal(self, i, x, y):
+        ram = self.rams[i]
+        macro = ram.rect(x, y)
+        if not macro.inside(self.core):
+            return False
+        halo = ram.halo(x, y)
+        if halo.y2 > ANALOG_Y:
+            return False
+        for j in range(len(self.rams)):
+            if j == i:
+                continue
+            if macro.overlaps(self.halos[j]) or halo.overlaps(self.macros[j]):
+                return False
+        return True
+
+    def update(self, i):
+        self.macros[i] = self.rams[i].rect()
+        self.halos[i] = self.rams[i].halo()
+
+    def swap(self, i, j):
+        a = self.rams[i]
+        b = self.rams[j]
+        a.x, a.y, b.x, b.y = b.x, b.y, a.x, a.y
+        self.update(i)
+        self.update(j)
+
+    def cost(self):
+        ax, ay = self.anchor
+        total = 0
+        for ram in self.rams:
+            x, y = ram.pins()
+            total = total + ram.npins * (abs(x - ax) + abs(y - ay))
+        for rams in self.groups.values():
+            points = [ram.pins() for ram in rams] + [self.anchor]
+            xs = [x for x, _ in points]
+            ys = [y for _, y in points]
+            npins = sum(ram.npins for ram in rams) / len(rams)
+            total = total + npins * (max(xs) - min(xs) + max(ys) - min(ys))
+        return total
+
+    def move(self, temp):
+        """
+        Applies a random legal move, returns a function undoing it, or None
+        if the move is illegal
+        """
+        n = len(self.rams)
+        i = self.random.randrange(n)
+        ram = self.rams[i]
+        same = [j for j in range(n)
+                if (j != i) and (self.rams[j].macro == ram.macro)]
+        if same and (self.random.random() < 0.2):
+            # Same macro, so both stay legal
+            j = self.random.choice(same)
+            self.swap(i, j)
+            return lambda: self.swap(i, j)
+        # Displacement shrinks with the temperature, down to a single site
+        span_x = max(1, round(TOP_W / SITE_W * temp))
+        span_y = max(1, round(TOP_H / SITE_H * temp))
+        x = ram.x + self.random.randint(-span_x, span_x)
+        y = ram.y + self.random.randint(-span_y, span_y)
+        if not self.legal(i, x, y):
+            return None
+        old = (ram.x, ram.y)
+        ram.x, ram.y = x, y
+        self.update(i)
+        def undo():
+            ram.x, ram.y = old
+            self.update(i)
+        return undo
+
+    def run(self, iterations):
+        """Anneals from temperature 1 down to 1e-4, keeps the best result"""
+        cost = self.cost()
+        # Initial temperature in cost units from random moves
+        deltas = []
+        for i in range(200):
+            undo = self.move(0.1)
+            if undo is None:
+                continue
+            deltas.append(abs(self.cost() - cost))
+            undo()
+        t0 = max(sum(deltas) / max(len(deltas), 1), 1e-9)
+        best = cost
+        best_pos = [(ram.x, ram.y) for ram in self.rams]
+        alpha = math.pow(1e-4, 1 / max(iterations, 1))
+        temp = 1
+        for i in range(iterations):
+            temp = temp * alpha
+            undo = self.move(temp)
+            if undo is None:
+                continue
+            new = self.cost()
+            delta = new - cost
+            if (delta <= 0) or (self.random.random() < math.exp(-delta / (t0 * temp))):
+                cost = new
+                if cost < best:
+                    best = cost
+                    best_pos = [(ram.x, ram.y) for ram in self.rams]
+            else:
+                undo()
+        for i, (x, y) in enumerate(best_pos):
+            self.rams[i].x, self.rams[i].y = x, y
+            self.update(i)
+        return best
+
+    def table(self):
+        table = []
+        for ram in self.rams:
+            halo = ram.halo()
+            table.append({
+                    "inst": ram.inst,
+                    "macro": ram.macro,
+                    "x": ram.x,
+                    "y": ram.y,
+                    "orient": "N",
+                    "cut_left": halo.x1 - self.core.x1 < CUT_GAP,
+                    "cut_right": self.core.x2 - halo.x2 < CUT_GAP})
+        return table
+
+    def check(self):
+        """Checks the result with the same model as core_floorplan"""
+        model = PlacementModel([], [(self.core.x1, self.core.y1),
+                (self.core.x2, self.core.y2)])
+        model.add_keepout("analog", 0, ANALOG_Y, TOP_W, TOP_H - ANALOG_Y)
+        for ram in self.rams:
+            halo = ram.halo()
+            ram_x, ram_y = ram.origin()
+            model.add_macro(ram.inst, ram_x, ram_y, ram.w, ram.h,
+                    (halo.x1, halo.y1, halo.x2 - halo.x1, halo.y2 - halo.y1))
+        model.check()
+
+def main():
+    parser = argparse.ArgumentParser(description="Place the SRAM macros by simulated annealing")
+    parser.add_argument("--table", default=RAM_TABLE, help="Initial placement table")
+    parser.add_argument("-o", "--output", help="Write the placement table here, e.g. " + RAM_TABLE)
+    parser.add_argument("--wrapper", default=WRAPPER_LEF, help="Wrapper LEF with the core pins")
+    parser.add_argument("--iterations", type=int, default=100000, help="Number of moves")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    args = parser.parse_args()
+    if args.iterations < 1:
+        parser.error("--iterations must be at least 1")
+
+    rams = [Ram(entry) for entry in load_table(args.table)]
+    annealer = Annealer(rams, core_anchor(args.wrapper), args.seed)
+    initial = annealer.cost()
+    final = annealer.run(args.iterations)
+    annealer.check()
+
+    table = annealer.table()
+    for entry in table:
+        cut = "left" if entry["cut_left"] else "right" if entry["cut_right"] else ""
+        print("%-56s %-34s %5d %4d %s" % (entry["inst"], entry["macro"],
+                entry["x"], entry["y"], cut))
+    print("Estimated wirelength %.0f -> %.0f (%.1f%%)" % (initial, final,
+            (final - initial) * 100 / initial))
+    if args.output:
+        write_table(args.output, table)
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,7 @@
+import mmap
+import os
+import re
+
 import siliconcompiler
 
 def make_docs():
@@ -14,17 +18,7 @@ def setup(chip):
     chip.set('tool', tool, 'input', step, index, f'{design}.vg')
     chip.set('tool', tool, 'output', step, index, f'{design}.vg')
 
-def run(chip):
-    design = chip.get('design')
-
-    in_mod = False
-    done_mod = False
-    with open(f'outputs/{design}.vg', 'w') as wf:
-      with open(f'inputs/{design}.vg', 'r') as rf:
-        for line in rf.readlines():
-          if in_mod:
-            if line.strip().startswith('endmodule'):
-              wf.write(''' VIA_L1M1_PR(vssd1);
+VIAS = b''' VIA_L1M1_PR(vssd1);
  VIA_L1M1_PR(vccd1);
  VIA_L1M1_PR_MR(vssd1);
  VIA_L1M1_PR_MR(vccd1);
@@ -59,10 +53,38 @@ def run(chip):
  VIA_via5_6_1740_3100_2_1_1600_1600(vssd1);
  VIA_via5_6_1740_3100_2_1_1600_1600(vccd1);
  VIA_via5_6_3100_3100_2_2_1600_1600(vssd1);
- VIA_via5_6_3100_3100_2_2_1600_1600(vccd1);\n''')
-          elif not done_mod:
-            if line.strip().startswith(f'module {design}'):
-              in_mod = True
-          wf.write(line)
+ VIA_via5_6_3100_3100_2_2_1600_1600(vccd1);\n'''
+
+ENDMODULE = re.compile(rb'^[ \t]*endmodule', re.M)
+
+def find_insertion(data, design):
+    '''Returns the offset of the first endmodule line of module design'''
+    module = re.compile(rb'^[ \t]*module[ \t]+' + re.escape(design.encode()) + rb'\b', re.M)
+    match = module.search(data)
+    if match is None:
+        return None
+    match = ENDMODULE.search(data, match.end())
+    if match is None:
+        return None
+    return match.start()
+
+def run(chip):
+    design = chip.get('design')
+
+    # The netlist is mapped and written out as three slices: everything
+    # before the insertion point, the via block and everything after it.
+    with open(f'inputs/{design}.vg', 'rb') as rf:
+        with open(f'outputs/{design}.vg', 'wb') as wf:
+            if os.fstat(rf.fileno()).st_size == 0:
+                return 0
+            with mmap.mmap(rf.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                offset = find_insertion(mm, design)
+                with memoryview(mm) as view:
+                    if offset is None:
+                        wf.write(view)
+                    else:
+                        wf.write(view[:offset])
+                        wf.write(VIAS)
+                        wf.write(view[offset:])
 
     return 0
@@ -1,5 +1,11 @@
+import os
+import sys
+
 import siliconcompiler
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import defstream
+
 def make_docs():
     '''Utility for covering 'pin' data types with 'drawing' data types in a DEF
     file. This is required for the eFabless MPW prechecks, because the mask
@@ -21,92 +27,56 @@ def setup(chip):
 def pin_fitler(pin):
     return (not 'vcc' in pin) and (not 'vdd' in pin) and (not 'vss' in pin) and (not pin.startswith("io_analog"))
 
+def write_stripes(wf, pins):
+    for pin in pins:
+        if pin.layer == 'met2':
+            ml = pin.w
+            xl = pin.x
+            xr = pin.x
+            yb = int(pin.y - pin.h / 2)
+            yu = int(pin.y + pin.h / 2)
+        else:
+            ml = pin.h
+            xl = int(pin.x - pin.w / 2)
+            xr = int(pin.x + pin.w / 2)
+            yb = pin.y
+            yu = pin.y
+        wf.write('    - %s ( PIN %s ) + USE SIGNAL\n'%(pin.net, pin.name))
+        wf.write('      + ROUTED %s %i + SHAPE STRIPE ( %i %i ) ( %i %i )\n'%(pin.layer, int(ml), xl, yb, xr, yu))
+        wf.write('      NEW %s %i + SHAPE STRIPE ( %i %i ) ( %i %i ) ;\n'%(pin.layer, int(ml), xl, yb, xr, yu))
+
 def run(chip):
     design = chip.get('design')
-    with open(f'inputs/{design}.def') as f:
-        with open(f'outputs/{design}.def', 'w') as wf:
-            # State-tracking variables for parsing the file.
-            in_pins = 0
-            in_pin = ''
-            in_net = ''
-            in_layer = ''
-            pin_w = 0
-            pin_h = 0
-            pin_locs = {}
 
-            # Process the file one line at a time:
-            # 1. Gather information about pin polys.
-            # 2. Add overlaps in the 'SPECIALNETS' section.
-            # Assumptions: 'PINS' comes before 'SPECIALNETS', and there is only one 'PINS' section.
-            for line in f:
-                l = line
+    # 1. Gather the placed non-power pins. (Power nets should go thru PDN)
+    # TODO: We should not use hardcoded prefixes for power nets to ignore.
+    with open(f'inputs/{design}.def') as f:
+        pins = [pin for pin in defstream.read_pins(f)
+                if (pin.status == 'PLACED') and (pin.layer in ('met2', 'met3')) and pin_fitler(pin.name)]
 
-                # We don't care about lines before the 'PINS' section; write them verbatim to new DEF.
-                if not in_pins:
-                    wf.write(l)
-                    # Start paying attention at the start of the 'PINS' section.
-                    if l.strip().startswith('PINS'):
-                        in_pins = 1
-                # Note name, dimensions, and net of each non-power pin. (Power nets should go thru PDN)
-                elif in_pins == 1:
-                    wf.write(l)
-                    if l.strip().startswith('END PINS'):
-                        in_pins = 2
-                    elif l.strip().startswith('-'):
-                        la = l.strip().split()
-                        in_pin = la[1]
-                        in_net = la[4]
-                    # TODO: We should not use hardcoded prefixes for power nets to ignore.
-                    elif ('LAYER' in l) and (pin_fitler(in_pin)):
-                        la = l.strip().split()
-                        in_layer = la[2]
-                        pin_w = abs(int(la[8]) - int(la[4]))
-                        pin_h = abs(int(la[9]) - int(la[5]))
-                    elif ('PLACED' in l) and (pin_fitler(in_pin)):
-                        la = l.strip().split()
-                        pin_locs[in_pin] = {'layer': in_layer,
-                                            'net': in_net,
-                                            'x': int(la[3]),
-                                            'y': int(la[4]),
-                                            'w': pin_w,
-                                            'h': pin_h}
-                # After the 'PINS' section, look for 'SPECIALNETS' section and add tracks over each pin.
-                # This section may not exist; create it if we find 'END NETS' before 'SPECIALNETS'
-                elif in_pins == 2:
-                    if l.strip().startswith('SPECIALNETS'):
-                        la = l.strip().split()
-                        numnets = int(la[1]) + len(pin_locs)
-                        wf.write('SPECIALNETS %i ;\n'%numnets)
-                    # (There may not be a SPECIALNETS section in the DEF output)
-                    elif l.strip().startswith('END NETS'):
-                        wf.write(l)
-                        numnets = len(pin_locs)
-                        wf.write('SPECIALNETS %i ;\n'%numnets)
-                    elif (l.strip() == 'END SPECIALNETS') or (l.strip() == 'END DESIGN'):
-                        for k, v in pin_locs.items():
-                            ml = 0
-                            if v['layer'] == 'met2':
-                                ml = v['w']
-                                xl = v['x']
-                                xr = v['x']
-                                yb = int(v['y'] - v['h'] / 2)
-                                yu = int(v['y'] + v['h'] / 2)
-                            elif v['layer'] == 'met3':
-                                ml = v['h']
-                                xl = int(v['x'] - v['w'] / 2)
-                                xr = int(v['x'] + v['w'] / 2)
-                                yb = v['y']
-                                yu = v['y']
-                            wf.write('    - %s ( PIN %s ) + USE SIGNAL\n'%(v['net'], k))
-                            wf.write('      + ROUTED %s %i + SHAPE STRIPE ( %i %i ) ( %i %i )\n'%(v['layer'], int(ml), xl, yb, xr, yu))
-                            wf.write('      NEW %s %i + SHAPE STRIPE ( %i %i ) ( %i %i ) ;\n'%(v['layer'], int(ml), xl, yb, xr, yu))
-                        if l.strip() == 'END DESIGN':
-                            wf.write('END SPECIALNETS\n')
-                        wf.write(l)
-                        in_pins = 3
-                    else:
-                        wf.write(l)
-                elif in_pins == 3:
-                    wf.write(l)
+    # 2. Copy the DEF, adding a stripe over each pin in 'SPECIALNETS'. The
+    # section is created right before 'NETS' (or 'END DESIGN') if it doesn't
+    # exist.
+    with open(f'inputs/{design}.def') as f:
+        with open(f'outputs/{design}.def', 'w') as out:
+            wf = defstream.Writer(out)
+            done = False
+            for statement in defstream.statements(f):
+                kind = statement.kind
+                section = statement.section
+                if (section == 'SPECIALNETS') and (kind == defstream.START):
+                    wf.write('SPECIALNETS %i ;\n'%(statement.count() + len(pins)))
+                    continue
+                if (section == 'SPECIALNETS') and (kind == defstream.END):
+                    write_stripes(wf, pins)
+                    done = True
+                elif (not done) and ((section == 'NETS') and (kind == defstream.START) or
+                        (statement.tokens[:2] == ['END', 'DESIGN'])):
+                    wf.write('SPECIALNETS %i ;\n'%len(pins))
+                    write_stripes(wf, pins)
+                    wf.write('END SPECIALNETS\n')
+                    done = True
+                wf.write_statement(statement)
+            wf.flush()
 
     return 0
@@ -225,4 +225,28 @@ module lsp(
     assign lsp_ix_mem_result_valid = lsp_dm_resp_valid &&
             (!m_abort && !(ag_m_speculate && ag_abort));
 
+    `ifdef VERBOSE
+    // Memory access trace, compared against Spike by trace_comparater.py.
+    // Printed when the access is passed to WB, same as lsp_wb_valid.
+    reg [63:0] ag_m_addr;
+    reg [63:0] ag_m_wdata;
+    always @(posedge clk) begin
+        if (handshaking) begin
+            ag_m_addr <= agu_addr;
+            ag_m_wdata <=
+                    (ix_lsp_mem_width == `MW_BYTE) ? {56'b0, ix_lsp_source[7:0]} :
+                    (ix_lsp_mem_width == `MW_HALF) ? {48'b0, ix_lsp_source[15:0]} :
+                    (ix_lsp_mem_width == `MW_WORD) ? {32'b0, ix_lsp_source[31:0]} :
+                    ix_lsp_source;
+        end
+        if (((lsp_wb_valid && lsp_wb_ready) || (!lsp_wb_valid)) &&
+                lsp_dm_resp_valid && !m_abort && !(ag_m_speculate && ag_abort)) begin
+            if (ag_m_wb_en)
+                $display("PC %016x LOAD [%016x]", ag_m_pc, ag_m_addr);
+            else
+                $display("PC %016x STORE [%016x] <- %016x", ag_m_pc, ag_m_addr, ag_m_wdata);
+        end
+    end
+    `endif
+
 endmodule
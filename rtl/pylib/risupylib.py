@@ -1,34 +1,37 @@
 import math
 from risuconsts import *
 from risutypes import *
-import copy
+import functools
+
+def freeze(type):
+    # Struct lists are mutable, turn them into Structs so they can be used
+    # as cache keys
+    return Struct.of(type)
+
+@functools.lru_cache(maxsize=None)
+def _reverse(type):
+    return type.reversed()
 
 def reverse(type):
-    reversed = copy.deepcopy(type)
-    for entry in reversed:
-        if entry[0] == "i":
-            entry[0] = "o"
-        elif entry[0] == "o":
-            entry[0] = "i"
-        # Don't touch io
-    return reversed
+    return _reverse(freeze(type))
+
+@functools.lru_cache(maxsize=None)
+def _handshake(type):
+    return type + [["o", "valid"], ["i", "ready"]]
 
 def handshake(type):
-    result = copy.deepcopy(type)
-    result.append(["o", "valid"])
-    result.append(["i", "ready"])
-    return result
-
-def _get_pin(entry):
-    if len(entry) == 3:
-        direction, name, size = entry
-        width = f" [{size-1}:0] "
-    else:
-        direction, name = entry
+    return _handshake(freeze(type))
+
+def _get_pin(field):
+    if field.scalar:
         width = " "
-    return direction, width, name
+    else:
+        width = f" [{field.width-1}:0] "
+    return field.direction, width, field.name
 
-def gen_port(prefix, type, reg=True, last_comma=True, count=1):
+@functools.lru_cache(maxsize=None)
+def _gen_port_str(prefix, type, reg, last_comma, count):
+    result = []
     for i in range(count):
         postfix = "" if count == 1 else str(i)
         out = "" # Save into string so last comma could be easily stripped
@@ -49,18 +52,36 @@ def gen_port(prefix, type, reg=True, last_comma=True, count=1):
                 out = out[:-2]
             else:
                 out = out[:-1] # Remove trailing new line
-        print(out, end="")
+        result.append(out)
+    return "".join(result)
 
-def gen_wire(prefix, type, count=1):
+def gen_port_str(prefix, type, reg=True, last_comma=True, count=1):
+    return _gen_port_str(prefix, freeze(type), reg, last_comma, count)
+
+def gen_port(prefix, type, reg=True, last_comma=True, count=1):
+    print(gen_port_str(prefix, type, reg, last_comma, count), end="")
+
+@functools.lru_cache(maxsize=None)
+def _gen_wire_str(prefix, type, count):
+    result = []
     for i in range(count):
         postfix = "" if count == 1 else str(i)
         for entry in type:
             _, width, name = _get_pin(entry)
-            print("wire" + width + prefix + "_" + name + postfix + ";")
+            result.append("wire" + width + prefix + "_" + name + postfix + ";\n")
+    return "".join(result)
 
-def gen_connect(port_prefix, type, wire_prefix="", last_comma=True, count=1):
+def gen_wire_str(prefix, type, count=1):
+    return _gen_wire_str(prefix, freeze(type), count)
+
+def gen_wire(prefix, type, count=1):
+    print(gen_wire_str(prefix, type, count), end="")
+
+@functools.lru_cache(maxsize=None)
+def _gen_connect_str(port_prefix, type, wire_prefix, last_comma, count):
     if wire_prefix == "":
         wire_prefix = port_prefix
+    result = []
     for i in range(count):
         postfix = "" if count == 1 else str(i)
         out = ""
@@ -72,26 +93,52 @@ def gen_connect(port_prefix, type, wire_prefix="", last_comma=True, count=1):
                 out = out[:-2]
             else:
                 out = out[:-1] # Remove trailing new line
-        print(out, end="")
+        result.append(out)
+    return "".join(result)
 
-def gen_cat(type, prefix):
+def gen_connect_str(port_prefix, type, wire_prefix="", last_comma=True, count=1):
+    return _gen_connect_str(port_prefix, freeze(type), wire_prefix, last_comma, count)
+
+def gen_connect(port_prefix, type, wire_prefix="", last_comma=True, count=1):
+    print(gen_connect_str(port_prefix, type, wire_prefix, last_comma, count), end="")
+
+@functools.lru_cache(maxsize=None)
+def _gen_cat_str(type, prefix):
     out = "{"
     for entry in type:
         _, _, name = _get_pin(entry)
         out += prefix + "_" + name + ","
-    out = out[:-1] + "}"
-    print(out, end="")
+    return out[:-1] + "}"
+
+def gen_cat_str(type, prefix):
+    return _gen_cat_str(freeze(type), prefix)
+
+def gen_cat(type, prefix):
+    print(gen_cat_str(type, prefix), end="")
+
+def width_of(type):
+    return freeze(type).width
 
 def count_bits(type):
-    bits = 0
-    for entry in type:
-        if len(entry) == 3:
-            _, _, size = entry
+    print(width_of(type), end="")
+
+@functools.lru_cache(maxsize=None)
+def _gen_unpack_str(type, prefix, src):
+    out = ""
+    for name, msb, lsb in type.slices():
+        if msb == lsb:
+            out += "assign " + prefix + "_" + name + " = " + src + "[" + str(lsb) + "];\n"
         else:
-            size = 1
-        bits += size
-    print(bits, end="")
+            out += "assign " + prefix + "_" + name + " = " + src + "[" + str(msb) + ":" + str(lsb) + "];\n"
+    return out
+
+def gen_unpack_str(type, prefix, src):
+    # Reverse of gen_cat, split the packed vector src back into wires
+    return _gen_unpack_str(freeze(type), prefix, src)
+
+def gen_unpack(type, prefix, src):
+    print(gen_unpack_str(type, prefix, src), end="")
 
 # Test stuff
 if __name__ == '__main__':
-    gen_port(dec_common_t)
\ No newline at end of file
+    gen_port("dec", dec_common_t)
\ No newline at end of file
@@ -0,0 +1,117 @@
+# Struct type used by risutypes
+# A struct is an immutable, ordered list of fields. The layout of every field
+# is computed once when the struct is created, the first field takes the
+# most significant bits, matching gen_cat() concatenation order.
+
+class Field:
+    __slots__ = ("direction", "name", "width", "scalar", "offset")
+
+    def __init__(self, direction, name, width=None, offset=0):
+        object.__setattr__(self, "direction", direction)
+        object.__setattr__(self, "name", name)
+        # If width is not given, it's treated as 1 bit scalar
+        object.__setattr__(self, "scalar", width is None)
+        object.__setattr__(self, "width", 1 if width is None else width)
+        object.__setattr__(self, "offset", offset)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Field is immutable")
+
+    @property
+    def msb(self):
+        return self.offset + self.width - 1
+
+    @property
+    def lsb(self):
+        return self.offset
+
+    def entry(self):
+        # Same form as the original [direction, name, width] lists
+        if self.scalar:
+            return (self.direction, self.name)
+        return (self.direction, self.name, self.width)
+
+    def __len__(self):
+        return 2 if self.scalar else 3
+
+    def __iter__(self):
+        return iter(self.entry())
+
+    def __getitem__(self, i):
+        return self.entry()[i]
+
+    def __repr__(self):
+        return repr(self.entry())
+
+class Struct:
+    __slots__ = ("fields", "width", "_index", "_key")
+
+    def __init__(self, entries):
+        entries = [e.entry() if isinstance(e, Field) else tuple(e) for e in entries]
+        width = 0
+        for entry in entries:
+            width += entry[2] if len(entry) == 3 else 1
+        fields = []
+        index = {}
+        offset = width
+        for entry in entries:
+            field_width = entry[2] if len(entry) == 3 else 1
+            offset -= field_width
+            field = Field(*entry[:3], offset=offset)
+            index[field.name] = field
+            fields.append(field)
+        object.__setattr__(self, "fields", tuple(fields))
+        object.__setattr__(self, "width", width)
+        object.__setattr__(self, "_index", index)
+        object.__setattr__(self, "_key", tuple(entries))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Struct is immutable")
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._index[key]
+        if isinstance(key, slice):
+            return Struct(self.fields[key])
+        return self.fields[key]
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __add__(self, other):
+        return Struct(self._key + Struct.of(other)._key)
+
+    def __radd__(self, other):
+        return Struct(Struct.of(other)._key + self._key)
+
+    def __eq__(self, other):
+        return isinstance(other, Struct) and (self._key == other._key)
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __repr__(self):
+        return "Struct(" + repr(list(self._key)) + ")"
+
+    @staticmethod
+    def of(type):
+        """Returns type as a Struct, type can be a struct or a list of entries"""
+        return type if isinstance(type, Struct) else Struct(type)
+
+    def names(self):
+        return tuple(self._index)
+
+    def slices(self):
+        """Returns (name, msb, lsb) of each field in the packed vector"""
+        return tuple((f.name, f.msb, f.lsb) for f in self.fields)
+
+    def reversed(self):
+        """Returns the struct with input and output swapped, io untouched"""
+        dir_map = {"i": "o", "o": "i"}
+        return Struct((dir_map.get(e[0], e[0]),) + e[1:] for e in self._key)
@@ -1,21 +1,23 @@
 from risuconsts import *
+from risustruct import Struct
 # Struct: [direction, name, width]
 # Direction is (loosely) defined as source -> sink
 # If width is not given, it's treated as 1 bit scalar
+# Struct() precomputes the bit layout of the fields, see risustruct.py
 
 # If signals
-if_dec_t = [
+if_dec_t = Struct([
     ["o", "pc", 64],
     ["o", "instr", 32],
     ["o", "bp"],
     ["o", "bp_track", 2],
     ["o", "bt", 64],
     ["o", "page_fault"]
-]
+])
 
 ## Decoded instruction
 # Commomn signal sent to all FUs
-dec_common_t = [
+dec_common_t = Struct([
     ["o", "pc", 64],
     ["o", "op_type", 3],
     ["o", "operand1", 2],
@@ -25,10 +27,10 @@ dec_common_t = [
     ["o", "rs1", 5],
     ["o", "rs2", 5],
     ["o", "rd", 5]
-]
+])
 
 # Integer/ branch FU only signal
-dec_int_t = [
+dec_int_t = Struct([
     ["o", "op", 4],
     ["o", "option"],
     ["o", "truncate"],
@@ -41,38 +43,38 @@ dec_int_t = [
     ["o", "bp"],
     ["o", "bp_track", 2],
     ["o", "bt", 64]
-]
+])
 
 # Load store FU only signal
-dec_ls_t = [
+dec_ls_t = Struct([
     ["o", "mem_sign"],
     ["o", "mem_width", 2]
-]
+])
 
 # CSR handling FU only signal
-dec_csr_t = [
+dec_csr_t = Struct([
     ["o", "csr_op", 2],
     ["o", "mret"],
     ["o", "intr"],
     ["o", "cause", 4]
-]
+])
 
 # Multiplier/ divider FU only signal
-dec_md_t = [
+dec_md_t = Struct([
     ["o", "md_op", 3],
     ["o", "muldiv"]
-]
+])
 
 # Issue logic only signal
-dec_ix_t = [
+dec_ix_t = Struct([
     ["o", "legal"],
     ["o", "fencei"],
     ["o", "page_fault"]
-]
+])
 
 dec_instr_t = dec_common_t + dec_int_t + dec_ls_t + dec_csr_t + dec_md_t + dec_ix_t
 
-ix_ip_t = [
+ix_ip_t = Struct([
     ["o", "pc", 64],
     ["o", "dst", 5],
     ["o", "wb_en"],
@@ -91,27 +93,27 @@ ix_ip_t = [
     ["o", "bp_track", 2],
     ["o", "bt", 64],
     ["o", "speculate"]
-]
+])
 
-rf_rd_t = [
+rf_rd_t = Struct([
     ["i", "rsrc", 5],
     ["o", "rdata", 64]
-]
+])
 
-rf_wr_t = [
+rf_wr_t = Struct([
     ["i", "wen"],
     ["i", "wdst", 5],
     ["i", "wdata", 64]
-]
+])
 
-wb_t = [
+wb_t = Struct([
     ["o", "dst", 5],
     ["o", "result", 64],
     ["o", "wb_en"],
     ["o", "valid"]
-]
+])
 
-ix_md_t = [
+ix_md_t = Struct([
     ["o", "pc", 64],
     ["o", "dst", 5],
     ["o", "operand1", 64],
@@ -119,9 +121,9 @@ ix_md_t = [
     ["o", "md_op", 3],
     ["o", "muldiv"],
     ["o", "speculate"]
-]
+])
 
-ip_if_t = [
+ip_if_t = Struct([
     ["o", "branch"],
     ["o", "branch_taken"],
     ["o", "branch_pc", 64],
@@ -130,9 +132,9 @@ ip_if_t = [
     ["o", "branch_track", 2],
     ["o", "pc_override"],
     ["o", "new_pc", 64]
-]
+])
 
-ix_lsp_t = [
+ix_lsp_t = Struct([
     ["o", "pc", 64],
     ["o", "dst", 5],
     ["o", "wb_en"],
@@ -142,9 +144,9 @@ ix_lsp_t = [
     ["o", "mem_sign"],
     ["o", "mem_width", 2],
     ["o", "speculate"]
-]
+])
 
-ix_trap_t = [
+ix_trap_t = Struct([
     ["o", "pc", 64],
     ["o", "dst", 5],
     ["o", "csr_op", 2],
@@ -154,17 +156,17 @@ ix_trap_t = [
     ["o", "int"],
     ["o", "intexc"],
     ["o", "cause", 4],
-]
+])
 
-romem_if_t = [
+romem_if_t = Struct([
     ["o", "req_addr", 64],
     ["o", "req_valid"],
     ["i", "req_ready"],
     ["i", "resp_rdata", 64],
     ["i", "resp_valid"]
-]
+])
 
-rwmem_if_t = [
+rwmem_if_t = Struct([
     ["o", "req_addr", 64],
     ["o", "req_wdata", 64],
     ["o", "req_wmask", 8],
@@ -173,12 +175,12 @@ rwmem_if_t = [
     ["i", "req_ready"],
     ["i", "resp_rdata", 64],
     ["i", "resp_valid"]
-]
+])
 
-du_rob_t = [
+du_rob_t = Struct([
     ["i", "rd", 5],
     ["i", "wb_en"],
     ["i", "oprn", 6],
     ["o", "tag", ROB_ABITS],
     ["i", "valid"]
-]
+])
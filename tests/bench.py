@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+#
+# RISu64
+# Copyright 2022 Wenting Zhang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Performance benchmark: run CoreMark and the simple tests on the simulator
+# over a matrix of memory latencies, keep the results in a history database
+# and flag IPC regressions against a baseline.
+import argparse
+import concurrent.futures
+import itertools
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, DIR)
+import simstats
+import testrunner
+
+SCHEMA = """
+create table if not exists runs (
+    id integer primary key,
+    time real,
+    git_commit text,
+    label text,
+    baseline integer default 0
+);
+create table if not exists results (
+    run integer references runs(id),
+    bench text,
+    ilat integer,
+    dlat integer,
+    cycles integer,
+    instret integer,
+    ipc real,
+    stats text,
+    passed integer
+);
+"""
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                cwd=DIR, capture_output=True, text=True, check=True)
+        dirty = subprocess.run(["git", "status", "--porcelain", "-uno"],
+                cwd=DIR, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+    return commit.stdout.strip() + ("-dirty" if dirty.stdout.strip() else "")
+
+def find_benchmarks(names):
+    """returns {name: binary}, names may be coremark or simple"""
+    benchmarks = {}
+    for name in names:
+        if name == "coremark":
+            benchmarks["coremark"] = os.path.join(DIR, "coremark", "coremark.bin")
+        elif name == "simple":
+            simple = os.path.join(DIR, "simple")
+            for fn in sorted(os.listdir(simple)):
+                if fn.endswith(".S"):
+                    benchmarks["simple/" + fn[:-2]] = \
+                            os.path.join(simple, fn[:-2] + ".bin")
+        else:
+            raise SystemExit(f"Unknown benchmark {name}")
+    return benchmarks
+
+def build(names):
+    targets = {"coremark": ("coremark", "all"), "simple": ("simple", "bin")}
+    for name in names:
+        subdir, target = targets[name]
+        subprocess.run(["make", "-C", os.path.join(DIR, subdir), target],
+                check=True)
+
+def parse_list(s):
+    return [int(x) for x in s.split(",")]
+
+def open_db(fn):
+    db = sqlite3.connect(fn)
+    db.executescript(SCHEMA)
+    # Databases created before the passed column
+    columns = [row[1] for row in db.execute("pragma table_info(results)")]
+    if "passed" not in columns:
+        db.execute("alter table results add column passed integer")
+    return db
+
+def save_run(db, label, baseline, rows):
+    cur = db.execute("insert into runs (time, git_commit, label, baseline) "
+            "values (?, ?, ?, ?)", (time.time(), git_commit(), label,
+            1 if baseline else 0))
+    run = cur.lastrowid
+    db.executemany("insert into results (run, bench, ilat, dlat, cycles, "
+            "instret, ipc, stats, passed) values (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(run, bench, ilat, dlat, stats.get("cycles"), stats.get("instret"),
+            stats.get("ipc"), json.dumps(stats), stats.get("passed"))
+            for (bench, ilat, dlat), stats in rows.items()])
+    db.commit()
+    return run
+
+def load_baseline(db, exclude):
+    """returns {(bench, ilat, dlat): ipc} of the latest baseline run"""
+    row = db.execute("select id, git_commit from runs where baseline = 1 "
+            "and id != ? order by id desc limit 1", (exclude,)).fetchone()
+    if row is None:
+        return None, {}
+    baseline = {}
+    for bench, ilat, dlat, ipc in db.execute("select bench, ilat, dlat, ipc "
+            "from results where run = ?", (row[0],)):
+        baseline[(bench, ilat, dlat)] = ipc
+    return row[1], baseline
+
+def run_error(returncode, stats, cycles):
+    """
+    Returns why a run can't be used, None if it can. The exit code only
+    tells if a riscv-tests style test passed, CoreMark and the simple
+    programs stop at ebreak and fail that check, so it's not used here.
+    """
+    if returncode is None:
+        return "timeout"
+    if (stats.instret is None) or (stats.cycles is None):
+        return f"no statistics, exit code {returncode}"
+    if cycles and (stats.sim_cycles is not None) and \
+            (stats.sim_cycles > cycles):
+        return f"cycle limit {cycles} reached"
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Benchmark RISu64 on the simulator")
+    parser.add_argument("benchmarks", nargs="*", default=["coremark", "simple"],
+            help="coremark and/or simple")
+    parser.add_argument("--sim", default=os.path.join(DIR, "..", "sim",
+            "simulator"), help="Simulator executable")
+    parser.add_argument("--ilat", type=parse_list, default=[1],
+            help="Comma separated instruction memory latencies")
+    parser.add_argument("--dlat", type=parse_list, default=[1],
+            help="Comma separated data memory latencies")
+    parser.add_argument("--cycles", type=int,
+            help="Simulation cycle limit, unlimited by default")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count(),
+            help="Number of simulations running at the same time")
+    parser.add_argument("--timeout", type=float, default=3600,
+            help="Seconds before a simulation is killed")
+    parser.add_argument("--no-build", action="store_true",
+            help="Use the existing benchmark binaries")
+    parser.add_argument("--db", default=os.path.join(DIR, ".bench.sqlite"),
+            help="History database")
+    parser.add_argument("--label", default="", help="Stored with the run")
+    parser.add_argument("--set-baseline", action="store_true",
+            help="Use this run as baseline for later runs")
+    parser.add_argument("--threshold", type=float, default=1.0,
+            help="IPC drop in percent reported as a regression")
+    args = parser.parse_args()
+
+    if not args.no_build:
+        build(args.benchmarks)
+    benchmarks = find_benchmarks(args.benchmarks)
+    sim = os.path.abspath(args.sim)
+
+    def run(config):
+        bench, ilat, dlat = config
+        cmd = [sim, "--ram", benchmarks[bench], "--ilat", str(ilat),
+                "--dlat", str(dlat)]
+        if args.cycles:
+            cmd = cmd + ["--cycles", str(args.cycles)]
+        returncode, output, duration = testrunner.run_command(cmd, args.timeout)
+        stats = simstats.SimStats.parse(output.splitlines())
+        return config, returncode, stats, duration
+
+    configs = list(itertools.product(sorted(benchmarks), args.ilat, args.dlat))
+    rows = {}
+    failed = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        for config, returncode, stats, duration in \
+                pool.map(run, configs):
+            bench, ilat, dlat = config
+            error = run_error(returncode, stats, args.cycles)
+            if error:
+                print(f"FAILED {bench} ilat {ilat} dlat {dlat}: {error}")
+                failed = failed + 1
+                continue
+            rows[config] = stats.to_dict()
+            print(f"{bench:24} ilat {ilat} dlat {dlat}: {stats.cycles:10} "
+                    f"cycles {stats.instret:10} instret "
+                    f"IPC {rows[config]['ipc']:.3f} ({duration:.1f}s)")
+
+    db = open_db(args.db)
+    run_id = save_run(db, args.label, args.set_baseline, rows)
+    commit, baseline = load_baseline(db, run_id)
+    regressions = 0
+    if baseline:
+        for config, stats in sorted(rows.items()):
+            old = baseline.get(config)
+            if not old or (stats["ipc"] is None):
+                continue
+            change = (stats["ipc"] - old) / old * 100
+            if change < -args.threshold:
+                regressions = regressions + 1
+                bench, ilat, dlat = config
+                print(f"REGRESSION {bench} ilat {ilat} dlat {dlat}: IPC "
+                        f"{old:.3f} -> {stats['ipc']:.3f} ({change:+.2f}%)")
+        print(f"{regressions} IPC regressions beyond {args.threshold:g}% "
+                f"against baseline {commit}.")
+    elif not args.set_baseline:
+        print("No baseline to compare against, use --set-baseline.")
+    if args.set_baseline:
+        print(f"Saved run {run_id} as baseline.")
+    db.close()
+    return 1 if (failed or regressions) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
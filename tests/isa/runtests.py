@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+#
+# RISu64
+# Copyright 2022 Wenting Zhang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Run the ISA tests in parallel, replaces the serial loop in test.sh
+import argparse
+import glob
+import os
+import sys
+import time
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIR))
+import testrunner
+from testrunner import Result
+
+def main():
+    parser = argparse.ArgumentParser(description="Run RISu64 ISA tests")
+    parser.add_argument("tests", nargs="*",
+            help="Test binaries, all *.bin in the test directory by default")
+    parser.add_argument("--sim", default=os.path.join(DIR, "..", "..", "sim",
+            "simulator"), help="Simulator executable")
+    parser.add_argument("--cycles", type=int, default=200000,
+            help="Simulation cycle limit of each test")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count(),
+            help="Number of tests running at the same time")
+    parser.add_argument("--timeout", type=float, default=120,
+            help="Seconds before a test is killed and counted as failed")
+    parser.add_argument("--timings", default=os.path.join(DIR, ".timings.json"),
+            help="Durations of previous runs, used to start slow tests first")
+    parser.add_argument("--junit", help="Write JUnit XML results to this file")
+    parser.add_argument("--json", help="Write JSON results to this file")
+    parser.add_argument("--verbose", "-v", action="store_true",
+            help="Print the simulator output of failed tests")
+    args = parser.parse_args()
+
+    tests = args.tests or sorted(glob.glob(os.path.join(DIR, "*.bin")))
+    paths = {os.path.basename(fn): os.path.abspath(fn) for fn in tests}
+    sim = os.path.abspath(args.sim)
+
+    def run(name):
+        returncode, output, duration = testrunner.run_command(
+                [sim, "--ram", paths[name], "--cycles", str(args.cycles)],
+                args.timeout)
+        if returncode is None:
+            return Result(name, False, duration, output,
+                    f"timeout after {args.timeout:g}s")
+        if returncode != 0:
+            return Result(name, False, duration, output,
+                    f"exit code {returncode}")
+        return Result(name, True, duration, output)
+
+    timings = testrunner.load_timings(args.timings)
+    names = testrunner.slowest_first(list(paths), timings)
+    start = time.perf_counter()
+    results = testrunner.run_tests(names, run, args.jobs)
+    duration = time.perf_counter() - start
+    results.sort(key=lambda result: result.name)
+
+    if args.verbose:
+        for result in results:
+            if not result.passed:
+                print(f"==== {result.name} ====")
+                print(result.output, end="")
+    failed = testrunner.print_summary(results)
+    print(f"Wall time {duration:.2f}s, sum of test time "
+            f"{sum(result.duration for result in results):.2f}s.")
+    testrunner.save_timings(args.timings, results)
+    if args.junit:
+        testrunner.write_junit(args.junit, "isa", results, duration)
+    if args.json:
+        testrunner.write_json(args.json, "isa", results, duration)
+    return testrunner.exit_code(failed)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+#
+# RISu64
+# Copyright 2022 Wenting Zhang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Profile a verbose RISu simulator log: IPC over time and per PC retire
+# statistics, from the "TIME:" and "PC ... WB/RETIRE" lines printed by WB.
+# Every TIME line is one cycle.
+import argparse
+import csv
+import json
+import re
+import sys
+
+from traceinput import open_trace
+
+class Profile:
+    """Retire statistics collected from one log"""
+
+    def __init__(self, window):
+        self.window = window
+        self.cycles = 0
+        self.retired = 0
+        # Retired instructions of every complete or current window
+        self.timeline = [0]
+        # Per PC: retire count, total and maximum cycles since the previous
+        # retire. The gap is charged to the instruction that ended it.
+        self.count = {}
+        self.gap = {}
+        self.max_gap = {}
+        self.last_retire = 0
+
+    def tick(self):
+        self.cycles = self.cycles + 1
+        if self.cycles % self.window == 0:
+            self.timeline.append(0)
+
+    def retire(self, pc):
+        gap = self.cycles - self.last_retire
+        self.last_retire = self.cycles
+        self.retired = self.retired + 1
+        self.timeline[-1] = self.timeline[-1] + 1
+        self.count[pc] = self.count.get(pc, 0) + 1
+        self.gap[pc] = self.gap.get(pc, 0) + gap
+        self.max_gap[pc] = max(self.max_gap.get(pc, 0), gap)
+
+    def windows(self):
+        """Yields (start cycle, cycles, retired, ipc) of every window"""
+        for i, retired in enumerate(self.timeline):
+            start = i * self.window
+            cycles = min(self.window, self.cycles - start)
+            if cycles <= 0:
+                break
+            yield start, cycles, retired, retired / cycles
+
+    def hotspots(self, key, n):
+        """Returns the n PCs with the largest value of key"""
+        table = getattr(self, key)
+        return sorted(table, key=lambda pc: (-table[pc], pc))[:n]
+
+def parse_log(f, window):
+    profile = Profile(window)
+    for line in f:
+        if line.startswith("TIME:"):
+            profile.tick()
+        elif line.startswith("PC "):
+            token = line.split(None, 3)
+            if (len(token) > 2) and ((token[2] == "WB") or
+                    (token[2] == "RETIRE")):
+                profile.retire(int(token[1], 16))
+    return profile
+
+RE_FUNC = re.compile(r"^([0-9a-f]+) <(.+)>:$")
+RE_INSN = re.compile(r"^\s+([0-9a-f]+):\s+[0-9a-f]+\s+(.+)$")
+
+def load_dump(fn):
+    """Returns {pc: "function: instruction"} from objdump -d output"""
+    symbols = {}
+    func = ""
+    with open(fn) as f:
+        for line in f:
+            line = line.rstrip()
+            match = RE_FUNC.match(line)
+            if match:
+                func = match.group(2)
+                continue
+            match = RE_INSN.match(line)
+            if match:
+                insn = " ".join(match.group(2).split())
+                symbols[int(match.group(1), 16)] = func + ": " + insn
+    return symbols
+
+def print_timeline(profile, width):
+    print(f"{'cycle':>12} {'retired':>9} {'IPC':>6}")
+    for start, cycles, retired, ipc in profile.windows():
+        bar = "#" * int(round(ipc / 2 * width))
+        print(f"{start:12} {retired:9} {ipc:6.3f} {bar}")
+
+def print_hotspots(profile, key, title, n, symbols):
+    print(title)
+    print(f"{'PC':>16} {'retired':>9} {'gap':>10} {'avg gap':>8} "
+            f"{'max gap':>8}")
+    for pc in profile.hotspots(key, n):
+        count = profile.count[pc]
+        print(f"{pc:016x} {count:9} {profile.gap[pc]:10} "
+                f"{profile.gap[pc] / count:8.2f} {profile.max_gap[pc]:8}  "
+                f"{symbols.get(pc, '')}")
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="IPC timeline and retire hot spots of a RISu log")
+    parser.add_argument("log",
+            help="Simulator log made with --verbose, - for stdin")
+    parser.add_argument("--window", "-w", type=int, default=10000,
+            help="Cycles per timeline window")
+    parser.add_argument("--top", "-n", type=int, default=20,
+            help="Number of PCs in each hot spot table")
+    parser.add_argument("--dump",
+            help="objdump -d output of the program, to annotate PCs")
+    parser.add_argument("--no-timeline", action="store_true",
+            help="Don't print the timeline")
+    parser.add_argument("--width", type=int, default=50,
+            help="Width of the timeline bars, full width is IPC 2")
+    parser.add_argument("--csv", help="Write the timeline as CSV")
+    parser.add_argument("--json", help="Write timeline and per PC stats as JSON")
+    args = parser.parse_args()
+
+    with open_trace(args.log) as f:
+        profile = parse_log(f, args.window)
+    symbols = load_dump(args.dump) if args.dump else {}
+
+    ipc = profile.retired / profile.cycles if profile.cycles else 0.0
+    print(f"Retired {profile.retired} instructions in {profile.cycles} "
+            f"cycles, IPC {ipc:.3f}, {len(profile.count)} distinct PCs.")
+    if not args.no_timeline:
+        print_timeline(profile, args.width)
+    print_hotspots(profile, "gap", "Top PCs by cycles since previous retire:",
+            args.top, symbols)
+    print_hotspots(profile, "count", "Top PCs by retire count:",
+            args.top, symbols)
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["start", "cycles", "retired", "ipc"])
+            writer.writerows(profile.windows())
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"cycles": profile.cycles, "retired": profile.retired,
+                    "window": profile.window,
+                    "timeline": [w[2] for w in profile.windows()],
+                    "pcs": {"%016x" % pc: {"retired": profile.count[pc],
+                    "gap": profile.gap[pc], "max_gap": profile.max_gap[pc]}
+                    for pc in sorted(profile.count)}}, f, indent=1)
+
+if __name__ == "__main__":
+    sys.exit(main())
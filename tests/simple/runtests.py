@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+#
+# RISu64
+# Copyright 2022 Wenting Zhang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Run the simple tests in parallel and compare their console output with
+# the golden <test>.expected files, replaces compare.sh
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIR))
+import testrunner
+from testrunner import Result
+
+CHUNK_SIZE = 4096
+
+def describe_mismatch(expected, actual, offset, context):
+    """
+    Describes the first difference at byte offset: its line and column,
+    the previous context lines and the differing line of both outputs.
+    """
+    line_start = expected.rfind(b"\n", 0, offset) + 1
+    lineno = expected.count(b"\n", 0, offset) + 1
+    lines = [f"first difference at byte {offset}, line {lineno}, "
+            f"column {offset - line_start + 1}"]
+    before = expected[:line_start].splitlines()[-context:] if context else []
+    for i, line in enumerate(before):
+        lines.append(f"  {lineno - len(before) + i:5}  {line!r}")
+    def rest_of_line(data):
+        end = data.find(b"\n", line_start)
+        return data[line_start:] if end < 0 else data[line_start:end + 1]
+    if offset < len(expected):
+        lines.append(f"- {lineno:5}  {rest_of_line(expected)!r}")
+    else:
+        lines.append(f"- {lineno:5}  <end of expected output>")
+    if offset < len(actual):
+        lines.append(f"+ {lineno:5}  {rest_of_line(actual)!r}")
+    else:
+        lines.append(f"+ {lineno:5}  <end of actual output>")
+    return "\n".join(lines)
+
+def compare_output(stream, expected):
+    """
+    Reads stream and compares it to expected while reading. Returns None
+    if equal, otherwise (offset, actual output read so far). Reading stops
+    at the first difference.
+    """
+    actual = bytearray()
+    while True:
+        chunk = stream.read1(CHUNK_SIZE)
+        if not chunk:
+            break
+        pos = len(actual)
+        actual += chunk
+        if expected[pos:pos + len(chunk)] != chunk:
+            for i in range(len(chunk)):
+                if (pos + i >= len(expected)) or (expected[pos + i] != chunk[i]):
+                    break
+            return pos + i, bytes(actual)
+    if len(actual) != len(expected):
+        return len(actual), bytes(actual)
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Run RISu64 simple tests")
+    parser.add_argument("tests", nargs="*",
+            help="Test names, all *.S in the test directory by default")
+    parser.add_argument("--sim", default=os.path.join(DIR, "..", "..", "sim",
+            "simulator"), help="Simulator executable")
+    parser.add_argument("--cycles", type=int, default=200000,
+            help="Simulation cycle limit of each test")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count(),
+            help="Number of tests running at the same time")
+    parser.add_argument("--timeout", type=float, default=120,
+            help="Seconds before a test is killed and counted as failed")
+    parser.add_argument("--context", "-n", type=int, default=3,
+            help="Lines shown before the first difference")
+    parser.add_argument("--update", action="store_true",
+            help="Write the current output as expected output")
+    parser.add_argument("--no-build", action="store_true",
+            help="Use the existing test binaries")
+    parser.add_argument("--junit", help="Write JUnit XML results to this file")
+    parser.add_argument("--json", help="Write JSON results to this file")
+    args = parser.parse_args()
+
+    names = args.tests or sorted(fn[:-2] for fn in os.listdir(DIR)
+            if fn.endswith(".S"))
+    if not args.no_build:
+        subprocess.run(["make", "-C", DIR] + [name + ".bin" for name in names],
+                check=True)
+    sim = os.path.abspath(args.sim)
+
+    def run(name):
+        start = time.perf_counter()
+        if args.update:
+            return update(name, start)
+        try:
+            with open(os.path.join(DIR, name + ".expected"), "rb") as f:
+                expected = f.read()
+        except OSError:
+            return Result(name, False, 0.0, "", "no expected output")
+        # The simulated console is printed to stderr
+        proc = testrunner.start_command([sim, "--ram",
+                os.path.join(DIR, name + ".bin"), "--cycles", str(args.cycles)],
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        timer = threading.Timer(args.timeout, testrunner.kill_command, (proc,))
+        timer.start()
+        mismatch = None
+        try:
+            mismatch = compare_output(proc.stderr, expected)
+        finally:
+            if mismatch is not None:
+                testrunner.kill_command(proc)
+            proc.stderr.close()
+            proc.wait()
+            timer.cancel()
+        duration = time.perf_counter() - start
+        if duration >= args.timeout:
+            return Result(name, False, duration, "",
+                    f"timeout after {args.timeout:g}s")
+        if mismatch is not None:
+            offset, actual = mismatch
+            return Result(name, False, duration,
+                    actual.decode(errors="replace"),
+                    describe_mismatch(expected, actual, offset, args.context))
+        return Result(name, True, duration)
+
+    def update(name, start):
+        proc = testrunner.start_command([sim, "--ram",
+                os.path.join(DIR, name + ".bin"), "--cycles", str(args.cycles)],
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            _, output = proc.communicate(timeout=args.timeout)
+        except subprocess.TimeoutExpired:
+            testrunner.kill_command(proc)
+            proc.communicate()
+            return Result(name, False, time.perf_counter() - start, "",
+                    f"timeout after {args.timeout:g}s")
+        with open(os.path.join(DIR, name + ".expected"), "wb") as f:
+            f.write(output)
+        return Result(name, True, time.perf_counter() - start, "",
+                "expected output updated")
+
+    start = time.perf_counter()
+    results = testrunner.run_tests(names, run, args.jobs)
+    duration = time.perf_counter() - start
+    failed = testrunner.print_summary(results)
+    if args.junit:
+        testrunner.write_junit(args.junit, "simple", results, duration)
+    if args.json:
+        testrunner.write_json(args.json, "simple", results, duration)
+    return testrunner.exit_code(failed)
+
+if __name__ == "__main__":
+    sys.exit(main())
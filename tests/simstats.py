@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+#
+# RISu64
+# Copyright 2022 Wenting Zhang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Parse the statistics printed by sim/simulator at the end of a run
+import argparse
+import csv
+import json
+import re
+import sys
+
+# Counter lines printed as "<label>: <value>", optionally followed by a
+# percentage in parentheses, and the field they are stored in
+COUNTERS = {
+    "Total frontend stall": "fe_stall",
+    "Frontend stall minus branching": "fe_stall_nobranch",
+    "Total cycles no issue at all": "no_issue",
+    "Total cycles issue 1 instruction": "one_issue",
+    "Total cycles issue 2 instructions": "dual_issue",
+    "Dual-issue dependency check fail": "dep_fail",
+    "Dual-issue RAW dependency": "dep_raw",
+    "Dual-issue WAW dependency": "dep_waw",
+    "Unsupported branch and load store issue": "str_brls",
+    "Unsupported branch and branch issue": "str_brbr",
+    "Unsupported branch and other issue": "str_brother",
+    "Stall due to branching": "branch_stall",
+    "Total branches": "branches",
+    "Taken branches": "taken",
+    "Branch predictor correct": "bp_correct",
+    "BTB miss on predicted branches": "btb_miss",
+    "Combined mistaken branches": "mispredicted",
+}
+
+RE_STOPPED = re.compile(r"Simulation stopped after (\d+) cycles")
+RE_SPEED = re.compile(r"average simulation speed: (\d+) kHz")
+RE_REG = re.compile(r"R(\d+) = ([0-9a-fA-F]+)$")
+RE_RETIRED = re.compile(
+        r"Retired (\d+) instructions in (\d+) cycles\. Average IPC: ([\d.]+)")
+RE_COUNTER = re.compile(r"([A-Za-z][\w ,/-]*?): (-?\d+)(?: \(.*\))?$")
+
+class SimStats:
+    """Statistics of one simulator run, counters are None if not printed"""
+
+    FIELDS = ["sim_cycles", "sim_khz", "instret", "cycles", "passed"] + \
+            list(COUNTERS.values())
+
+    def __init__(self):
+        for field in self.FIELDS:
+            setattr(self, field, None)
+        self.regs = {}
+
+    @staticmethod
+    def parse(lines):
+        """Parses simulator output, lines is an iterable of text lines"""
+        stats = SimStats()
+        for line in lines:
+            line = line.rstrip()
+            match = RE_RETIRED.match(line)
+            if match:
+                stats.instret = int(match.group(1))
+                stats.cycles = int(match.group(2))
+                continue
+            match = RE_STOPPED.match(line)
+            if match:
+                stats.sim_cycles = int(match.group(1))
+                continue
+            match = RE_SPEED.match(line)
+            if match:
+                stats.sim_khz = int(match.group(1))
+                continue
+            match = RE_REG.match(line)
+            if match:
+                stats.regs[int(match.group(1))] = int(match.group(2), 16)
+                continue
+            if line == "Test passed":
+                stats.passed = True
+                continue
+            if line == "Test failed":
+                stats.passed = False
+                continue
+            match = RE_COUNTER.match(line)
+            if match and (match.group(1) in COUNTERS):
+                setattr(stats, COUNTERS[match.group(1)], int(match.group(2)))
+        return stats
+
+    def derived(self):
+        """Returns metrics computed from the counters, None if unknown"""
+        def ratio(a, b):
+            if (a is None) or (not b):
+                return None
+            return a / b
+        cycles = self.cycles
+        issued = None
+        if (self.one_issue is not None) and (self.dual_issue is not None):
+            issued = self.one_issue + 2 * self.dual_issue
+        structural = None
+        if (self.str_brls is not None) and (self.str_brbr is not None) and \
+                (self.str_brother is not None):
+            structural = self.str_brls + self.str_brbr + self.str_brother
+        return {
+            "ipc": ratio(self.instret, cycles),
+            "cpi": ratio(cycles, self.instret),
+            # Share of cycles by number of instructions issued
+            "no_issue_ratio": ratio(self.no_issue, cycles),
+            "one_issue_ratio": ratio(self.one_issue, cycles),
+            "dual_issue_ratio": ratio(self.dual_issue, cycles),
+            "issue_ipc": ratio(issued, cycles),
+            # Stall breakdown, as share of all cycles
+            "fe_stall_ratio": ratio(self.fe_stall, cycles),
+            "fe_stall_nobranch_ratio": ratio(self.fe_stall_nobranch, cycles),
+            "branch_stall_ratio": ratio(self.branch_stall, cycles),
+            # Why the second instruction could not be issued, as share of
+            # cycles with a single issue
+            "dep_fail_ratio": ratio(self.dep_fail, self.one_issue),
+            "dep_raw_ratio": ratio(self.dep_raw, self.one_issue),
+            "dep_waw_ratio": ratio(self.dep_waw, self.one_issue),
+            "structural_ratio": ratio(structural, self.one_issue),
+            # Branches
+            "taken_ratio": ratio(self.taken, self.branches),
+            "bp_accuracy": ratio(self.bp_correct, self.branches),
+            "btb_miss_ratio": ratio(self.btb_miss, self.bp_correct),
+            "mispredict_ratio": ratio(self.mispredicted, self.branches),
+            "mpki": ratio(None if self.mispredicted is None else
+                    self.mispredicted * 1000, self.instret),
+        }
+
+    def to_dict(self):
+        record = {field: getattr(self, field) for field in self.FIELDS}
+        record.update(self.derived())
+        return record
+
+def parse_file(fn):
+    if fn == "-":
+        return SimStats.parse(sys.stdin)
+    with open(fn) as f:
+        return SimStats.parse(f)
+
+def write_csv(fn, records, append=False):
+    """Writes records (dicts with the same keys) as CSV rows"""
+    keys = list(records[0].keys())
+    header = True
+    if append:
+        try:
+            with open(fn) as f:
+                header = f.readline() == ""
+        except OSError:
+            pass
+    with open(fn, "a" if append else "w", newline="") as f:
+        writer = csv.DictWriter(f, keys)
+        if header:
+            writer.writeheader()
+        writer.writerows(records)
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Extract statistics from RISu64 simulator output")
+    parser.add_argument("logs", nargs="*", default=["-"],
+            help="Simulator output files, - for stdin")
+    parser.add_argument("--label", default="",
+            help="Stored with each record, such as the commit or config")
+    parser.add_argument("--json", help="Write the records as JSON")
+    parser.add_argument("--csv", help="Write the records as CSV")
+    parser.add_argument("--append", action="store_true",
+            help="Append to the CSV file instead of overwriting it")
+    args = parser.parse_args()
+
+    records = []
+    for fn in args.logs:
+        record = {"log": fn, "label": args.label}
+        record.update(parse_file(fn).to_dict())
+        records.append(record)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(records, f, indent=1)
+    if args.csv:
+        write_csv(args.csv, records, args.append)
+    if not (args.json or args.csv):
+        for record in records:
+            print(record["log"])
+            for key, value in record.items():
+                if isinstance(value, float):
+                    print(f"  {key}: {value:.4f}")
+                elif key not in ("log", "label"):
+                    print(f"  {key}: {value}")
+
+if __name__ == "__main__":
+    main()
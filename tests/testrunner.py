@@ -0,0 +1,148 @@
+#
+# RISu64
+# Copyright 2022 Wenting Zhang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Shared helpers for the test runners: run simulator jobs on a pool with
+# timeouts, report results like the old shell scripts and write JUnit/JSON.
+import concurrent.futures
+import json
+import math
+import os
+import signal
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+class Result:
+    """Outcome of one test"""
+
+    def __init__(self, name, passed, duration, output="", message=""):
+        self.name = name
+        self.passed = passed
+        self.duration = duration
+        self.output = output
+        self.message = message
+
+    def to_dict(self):
+        return {"name": self.name, "passed": self.passed,
+                "duration": self.duration, "message": self.message,
+                "output": self.output}
+
+def start_command(cmd, **kwargs):
+    """Starts cmd in its own process group, so kill_command can stop it"""
+    return subprocess.Popen(cmd, start_new_session=True, **kwargs)
+
+def kill_command(proc):
+    """Kills the process and everything it started"""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+def run_command(cmd, timeout, cwd=None):
+    """
+    Runs cmd, returns (returncode, output, duration). returncode is None
+    if the command was killed after timeout seconds.
+    """
+    start = time.perf_counter()
+    proc = start_command(cmd, cwd=cwd, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT)
+    try:
+        output, _ = proc.communicate(timeout=timeout)
+        returncode = proc.returncode
+    except subprocess.TimeoutExpired:
+        kill_command(proc)
+        output, _ = proc.communicate()
+        returncode = None
+    return returncode, output.decode(errors="replace"), \
+            time.perf_counter() - start
+
+def load_timings(fn):
+    try:
+        with open(fn) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_timings(fn, results):
+    timings = load_timings(fn)
+    for result in results:
+        timings[result.name] = result.duration
+    with open(fn, "w") as f:
+        json.dump(timings, f, indent=1, sort_keys=True)
+
+def slowest_first(names, timings):
+    """Orders tests by last known duration, tests never timed go first"""
+    return sorted(names, key=lambda name: -timings.get(name, math.inf))
+
+def run_tests(names, run, jobs):
+    """
+    Calls run(name) for every test on a pool of jobs threads, each run is
+    expected to wait on a subprocess. Results are printed as they finish
+    and returned in the original order.
+    """
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(run, name): name for name in names}
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results[result.name] = result
+            status = "Passed" if result.passed else "Failed"
+            message = result.message.split("\n", 1)
+            detail = f" ({message[0]})" if message[0] else ""
+            print(f"{status} {result.name}{detail} in {result.duration:.2f}s")
+            if len(message) > 1:
+                print(message[1])
+            sys.stdout.flush()
+    return [results[name] for name in names]
+
+def print_summary(results):
+    """Prints the summary line, returns the number of failed tests"""
+    passed = sum(1 for result in results if result.passed)
+    failed = len(results) - passed
+    print(f"Passed {passed} tests, failed {failed} tests.")
+    return failed
+
+def write_json(fn, suite, results, duration):
+    with open(fn, "w") as f:
+        json.dump({"suite": suite, "duration": duration,
+                "tests": [result.to_dict() for result in results]},
+                f, indent=1)
+
+def write_junit(fn, suite, results, duration):
+    failures = sum(1 for result in results if not result.passed)
+    root = ET.Element("testsuite", name=suite, tests=str(len(results)),
+            failures=str(failures), errors="0", time=f"{duration:.3f}")
+    for result in results:
+        case = ET.SubElement(root, "testcase", classname=suite,
+                name=result.name, time=f"{result.duration:.3f}")
+        if not result.passed:
+            failure = ET.SubElement(case, "failure",
+                    message=result.message or "failed")
+            failure.text = result.output
+        elif result.output:
+            ET.SubElement(case, "system-out").text = result.output
+    ET.ElementTree(root).write(fn, encoding="utf-8", xml_declaration=True)
+
+def exit_code(failed):
+    # Same as the old scripts, the number of failed tests
+    return min(failed, 255)
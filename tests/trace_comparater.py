@@ -22,38 +22,37 @@
 # SOFTWARE.
 #
 import argparse
-from weakref import ref
+import concurrent.futures
+import os
+from collections import deque
+import tracestore
+from traceinput import open_trace, is_plain_file
+from tracestore import TraceStore, numpy, STORE, LOAD, NSTREAMS
 
 # Global configurations
 converge_limit = 20
+queue_limit = 65536
 
-def main():
-    parser = argparse.ArgumentParser(
-            description="Compare trace generated by RISu and Spike")
-    parser.add_argument("--risu", "-r", required=True,
-            help="Trace log generated by RISu simulator")
-    parser.add_argument("--spike", "-s", required=True,
-            help="Trace log generated by Spike")
-    args = parser.parse_args()
+# Trace events are (rdst, lineno, pc, value). rdst 0 is an instruction
+# retired without register writeback, value is None for these. rdst -1 is an
+# instruction that has no event at all, only used to keep streams in pace.
+# Memory accesses follow the event of their instruction: rdst STORE with
+# value (address, data) and rdst LOAD with value (address,). They don't
+# count as instructions.
 
-    reg_trace_ref = []
-    reg_trace = []
-    for i in range(0, 32):
-        reg_trace_ref.append([])
-        reg_trace.append([])
+def hex64(value):
+    return "%016x" % int(value, 16)
 
-    # Parse reference trace
-    slog = open(args.spike, "r")
-    count = 0
-    foundstart = False
-    lineno = 0
+def parse_spike(slog, lineno=0, foundstart=False):
     for line in slog:
         lineno = lineno + 1
-        if (len(line) < 66):
+        if (line[0:1] != "c"):
             continue
-        if (line[0] != "c"):
+        if (line[10:11] != "3"):
             continue
-        if (line[10] != "3"):
+        if (len(line) < 66):
+            if foundstart:
+                yield (-1, lineno, line[10:].split()[1][2:], None)
             continue
         line = line[10:-1]
         token = line.split()
@@ -89,29 +88,30 @@ def main():
         else:
             rt = 1
         if rw:
-            event = (lineno, pc, value)
-            reg_trace_ref[rdst].append(event)
-            count = count + 1
-        if rt:
-            event = (lineno, pc)
-            reg_trace_ref[0].append(event)
-            count = count + 1
-    print(count, "reference writeback entry read.")
-
-    slog.close()
-    #print(reg_trace_ref)
+            yield (rdst, lineno, pc, value)
+        elif rt:
+            yield (0, lineno, pc, None)
+        else:
+            yield (-1, lineno, pc, None)
+        if mw:
+            yield (STORE, lineno, pc, (hex64(mwaddr), hex64(mwdata)))
+        if mr:
+            yield (LOAD, lineno, pc, (hex64(mraddr),))
 
-    # Parse risu trace
-    rlog = open(args.risu, "r")
-    count = 0
-    foundstart = False
-    lineno = 0
+def parse_risu(rlog, lineno=0):
     for line in rlog:
         lineno = lineno + 1
         if (line[0:2] != "PC"):
             continue
         line = line[3:-1]
         token = line.split()
+        if (token[1] == "STORE"):
+            yield (STORE, lineno, token[0],
+                    (hex64(token[2][1:-1]), hex64(token[4])))
+            continue
+        elif (token[1] == "LOAD"):
+            yield (LOAD, lineno, token[0], (hex64(token[2][1:-1]),))
+            continue
         if token[2] == "[":
             token.pop(2)
             token[2] = token[2][0]
@@ -119,50 +119,514 @@ def main():
             token[2] = token[2][1:3]
         pc = token[0]
         #print(token)
-        rw = 0
-        rt = 0
         if (token[1] == "WB"):
-            rw = 1
-            rdst = int(token[2])
-            value = token[4]
+            yield (int(token[2]), lineno, pc, token[4])
         elif (token[1] == "RETIRE"):
-            rt = 1
-        if rw:
-            event = (lineno, pc, value)
-            reg_trace[rdst].append(event)
-            count = count + 1
-        if rt:
-            event = (lineno, pc)
-            reg_trace[0].append(event)
-            count = count + 1
-    print(count, "actual writeback entry read.")
-    
-    rlog.close()
-    #print(reg_trace)
+            yield (0, lineno, pc, None)
+
+def check_event(i, ref_event, act_event):
+    """
+    Compare the i-th writeback of a register, returns None on match or the
+    mismatch report
+    """
+    ref_lineno, ref_pc, ref_result = ref_event
+    act_lineno, act_pc, act_result = act_event
+    if (ref_pc != act_pc):
+        return " ".join(["Line", str(ref_lineno), "(REF)", str(act_lineno),
+                "(ACTUAL)", "PC mismatch"])
+    elif (ref_result != act_result) and isinstance(ref_result, tuple):
+        return " ".join(["Line", str(ref_lineno), "(REF)", str(act_lineno),
+                "(ACTUAL)", "Store mismatch:" if len(ref_result) == 2 else
+                "Load mismatch:", str(i), format_access(ref_result), "(REF)",
+                format_access(act_result), "(ACTUAL)"])
+    elif (ref_result != act_result):
+        return " ".join(["Line", str(ref_lineno), "(REF)", str(act_lineno),
+                "(ACTUAL)", "Result mismatch:", str(i),
+                "<-", ref_result, "(REF)", act_result, "(ACTUAL)"])
+    return None
+
+def format_access(value):
+    if len(value) == 2:
+        return "[" + value[0] + "] <- " + value[1]
+    return "[" + value[0] + "]"
+
+def stream_name(r):
+    if r == STORE:
+        return "store"
+    elif r == LOAD:
+        return "load"
+    return "writeback to x" + str(r)
+
+def format_event(event):
+    rdst, lineno, pc, value = event
+    if rdst >= STORE:
+        return f"Line {lineno}: PC {pc} {stream_name(rdst)} {format_access(value)}"
+    elif rdst > 0:
+        return f"Line {lineno}: PC {pc} x{rdst} <- {value}"
+    elif rdst == 0:
+        return f"Line {lineno}: PC {pc} retire"
+    return f"Line {lineno}: PC {pc}"
+
+def print_context(stream, lineno, context):
+    """Print context retired instructions around lineno from the history"""
+    history = list(stream.history)
+    for idx in range(len(history)):
+        if history[idx][1] == lineno:
+            break
+    else:
+        print(stream.name, "line", lineno, "is no longer in history")
+        return
+    print("Context from", stream.name, "trace:")
+    for event in history[max(0, idx - context):idx + context + 1]:
+        mark = ">" if event[1] == lineno else " "
+        print(mark, format_event(event))
 
+def collect_trace(events):
+    store = TraceStore()
+    for rdst, lineno, pc, value in events:
+        if rdst == STORE:
+            store.append(STORE, lineno, int(pc, 16), int(value[1], 16),
+                    int(value[0], 16))
+        elif rdst == LOAD:
+            store.append(LOAD, lineno, int(pc, 16), 0, int(value[0], 16))
+        elif rdst > 0:
+            store.append(rdst, lineno, int(pc, 16), int(value, 16))
+        elif rdst == 0:
+            store.append(0, lineno, int(pc, 16), 0)
+    return store
+
+def load_trace(fn, parser, jobs=1, cache=False):
+    """
+    Parse fn into a TraceStore. With cache, a <fn>.rtrace sidecar is
+    mapped instead if it is valid, or written after parsing. Compressed
+    logs and stdin ("-") can't be split into shards, they are parsed on
+    a single process.
+    """
+    kind = parser.__name__
+    cache = cache and (fn != "-")
+    if cache:
+        store = tracestore.load_cache(fn, kind)
+        if store is not None:
+            print("Loaded", tracestore.cache_path(fn))
+            return store
+    if (jobs > 1) and is_plain_file(fn):
+        store = load_trace_parallel(fn, parser, jobs)
+    else:
+        with open_trace(fn) as f:
+            store = collect_trace(parser(f))
+    if cache and not tracestore.save_cache(fn, kind, store):
+        print("Unable to write", tracestore.cache_path(fn))
+    return store
+
+def shard_file(fn, nshards):
+    """Split fn into nshards byte ranges, each starting at a line boundary"""
+    size = os.path.getsize(fn)
+    bounds = [0]
+    with open(fn, "rb") as f:
+        for i in range(1, nshards):
+            f.seek(max(size * i // nshards, bounds[-1]))
+            f.readline()
+            bounds.append(min(f.tell(), size))
+    bounds.append(size)
+    return [(bounds[i], bounds[i + 1]) for i in range(nshards)
+            if bounds[i] < bounds[i + 1]]
+
+def read_shard(fn, start, end):
+    with open(fn, "rb") as f:
+        f.seek(start)
+        pos = start
+        for line in f:
+            if pos >= end:
+                break
+            pos = pos + len(line)
+            yield line.decode(errors="replace")
+
+def count_shard(fn, start, end):
+    count = 0
+    with open(fn, "rb") as f:
+        f.seek(start)
+        remain = end - start
+        while remain:
+            block = f.read(min(remain, 1 << 24))
+            if not block:
+                break
+            count = count + block.count(b"\n")
+            remain = remain - len(block)
+    return count
+
+def parse_shard(fn, start, end, lineoffset, parser, first):
+    """
+    Parse one shard. Only the first shard of the Spike log searches for the
+    start PC, later shards are parsed as if it was already found.
+    """
+    if parser is parse_spike:
+        events = parse_spike(read_shard(fn, start, end), lineoffset, not first)
+    else:
+        events = parser(read_shard(fn, start, end), lineoffset)
+    # Whether anything was found after the start PC
+    found = False
+    def mark(events):
+        nonlocal found
+        for event in events:
+            found = True
+            yield event
+    return collect_trace(mark(events)), found
+
+def load_trace_parallel(fn, parser, jobs):
+    """
+    Parse fn on a process pool. The file is split into byte range shards
+    aligned to line boundaries, lines are counted per shard first so every
+    shard knows its starting line number, then the shards are parsed and
+    the column stores are concatenated in order.
+    """
+    shards = shard_file(fn, jobs)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        lines = list(pool.map(count_shard, [fn] * len(shards),
+                [s[0] for s in shards], [s[1] for s in shards]))
+        offsets = [sum(lines[:i]) for i in range(len(shards))]
+        futures = [pool.submit(parse_shard, fn, start, end, offsets[i],
+                parser, i == 0) for i, (start, end) in enumerate(shards)]
+        results = [future.result() for future in futures]
+
+    # The Spike start PC may not be in the first shard, fall back to
+    # parsing in order until it is found
+    if parser is parse_spike:
+        for i in range(len(shards)):
+            if results[i][1]:
+                break
+            if i + 1 < len(shards):
+                results[i + 1] = parse_shard(fn, shards[i + 1][0],
+                        shards[i + 1][1], offsets[i + 1], parser, True)
+
+    store = TraceStore()
+    for shard_store, _ in results:
+        store.extend(shard_store)
+    return store
+
+class Comparator:
+    """
+    Matches per register writeback queues of both traces. Reports are
+    passed to report(ref_lineno, act_lineno, text) as they are found.
+
+    Without resync, the heads of both queues are always compared and
+    consumed together, so a single extra or missing writeback shows up as
+    a mismatch on every later writeback to that register. With resync, a
+    mismatch is only reported once up to resync writebacks of both queues
+    are available: if the head of one queue matches (pc and value) one of
+    the next resync entries of the other, the entries skipped over are
+    reported as missing/ extra, and the comparison continues from there.
+    """
+
+    def __init__(self, report, resync=0):
+        self.report = report
+        self.resync = resync
+        self.cmpidx = [0] * NSTREAMS
+        self.totalcmp = 0
+        self.memcmp = 0
+        self.mismatches = 0
+        self.inserted = 0
+        self.missing = 0
+
+    def _find(self, head, queue):
+        for k in range(1, min(len(queue), self.resync + 1)):
+            if check_event(0, head, queue[k]) is None:
+                return k
+        return 0
+
+    def drain(self, r, rq, aq, ref_done, act_done):
+        while rq and aq:
+            result = check_event(self.cmpidx[r], rq[0], aq[0])
+            if (result is not None) and self.resync:
+                # Wait for enough entries to look ahead
+                if not ((ref_done or (len(rq) > self.resync)) and
+                        (act_done or (len(aq) > self.resync))):
+                    return
+                # Actual missed k writebacks, or has k extra ones
+                kmiss = self._find(aq[0], rq)
+                kextra = self._find(rq[0], aq)
+                if kmiss and ((not kextra) or (kmiss <= kextra)):
+                    self.missing = self.missing + kmiss
+                    self.report(rq[0][0], aq[0][0], " ".join(["Line",
+                            str(rq[0][0]), "(REF)", str(aq[0][0]), "(ACTUAL)",
+                            str(kmiss), stream_name(r),
+                            "missing in ACTUAL, resynchronized"]))
+                    for k in range(kmiss):
+                        rq.popleft()
+                    continue
+                if kextra:
+                    self.inserted = self.inserted + kextra
+                    self.report(rq[0][0], aq[0][0], " ".join(["Line",
+                            str(rq[0][0]), "(REF)", str(aq[0][0]), "(ACTUAL)",
+                            str(kextra), "extra", stream_name(r),
+                            "in ACTUAL, resynchronized"]))
+                    for k in range(kextra):
+                        aq.popleft()
+                    continue
+            ref_event = rq.popleft()
+            act_event = aq.popleft()
+            self.cmpidx[r] = self.cmpidx[r] + 1
+            if r >= STORE:
+                self.memcmp = self.memcmp + 1
+            else:
+                self.totalcmp = self.totalcmp + 1
+            if result is not None:
+                self.mismatches = self.mismatches + 1
+                self.report(ref_event[0], act_event[0], result)
+
+    def summary(self):
+        if self.inserted or self.missing:
+            print("Resynchronized over", self.missing, "missing and",
+                    self.inserted, "extra writeback entry.")
+
+def print_report(ref_lineno, act_lineno, text):
+    print(text)
+
+def print_count(name, counts, memory):
+    writebacks, accesses = counts
+    print(writebacks, name, "writeback entry read.")
+    if memory:
+        print(accesses, name, "memory access entry read.")
+
+def print_compared(status, counts, memory):
+    writebacks, accesses = counts
+    if memory:
+        print(status + ",", writebacks, "writeback entry and", accesses,
+                "memory access entry compared.")
+    else:
+        print(status + ",", writebacks, "writeback entry compared.")
+
+def compare_stores(ref, act, report, streams):
+    """
+    Compare the i-th entry of every stream (register writeback or memory
+    access) in two stores. With numpy the pc, value and address columns
+    are compared vectorized, one stream at a time. Returns the number of
+    compared (writeback, memory access) entries.
+    """
+    ref_index = ref.register_index()
+    act_index = act.register_index()
     totalcmp = 0
-    # Compare register writeback
-    for r in range(1,32):
+    memcmp = 0
+    if numpy is not None:
+        ref_pc, ref_value = ref.column("pc"), ref.column("value")
+        act_pc, act_value = act.column("pc"), act.column("value")
+        ref_addr, act_addr = ref.column("addr"), act.column("addr")
+    for r in range(1, streams):
         # Compare up to the maximum recorded length
-        #print("Comparing register ", r)
-        cmplen = min(len(reg_trace_ref[r]), len(reg_trace[r]))
-        for i in range(cmplen):
-            ref_event = reg_trace_ref[r][i]
-            act_event = reg_trace[r][i]
-            ref_lineno, ref_pc, ref_result = ref_event
-            act_lineno, act_pc, act_result = act_event
-            if (ref_pc != act_pc):
-                print("Line", ref_lineno, "(REF)", act_lineno, "(ACTUAL)",
-                        "PC mismatch")
-            elif (ref_result != act_result):
-                print("Line", ref_lineno, "(REF)", act_lineno, "(ACTUAL)",
-                        "Result mismatch:", i,
-                        "<-", ref_result, "(REF)", act_result, "(ACTUAL)")
-            #print(ref_event)
-            #print(act_event)
-        totalcmp = totalcmp + cmplen
-
-    print("Done,", totalcmp, "writeback entry compared.")
+        cmplen = min(len(ref_index[r]), len(act_index[r]))
+        ri = ref_index[r][:cmplen]
+        ai = act_index[r][:cmplen]
+        if numpy is not None:
+            diff = numpy.flatnonzero((ref_pc[ri] != act_pc[ai]) |
+                    (ref_value[ri] != act_value[ai]) |
+                    (ref_addr[ri] != act_addr[ai]))
+        else:
+            diff = [i for i in range(cmplen)
+                    if (ref.pc[ri[i]] != act.pc[ai[i]]) or
+                    (ref.value[ri[i]] != act.value[ai[i]]) or
+                    (ref.addr[ri[i]] != act.addr[ai[i]])]
+        for i in diff:
+            ref_event = next(ref.events([ri[i]]))
+            act_event = next(act.events([ai[i]]))
+            report(ref_event[0], act_event[0],
+                    check_event(int(i), ref_event, act_event))
+        if r >= STORE:
+            memcmp = memcmp + cmplen
+        else:
+            totalcmp = totalcmp + cmplen
+    return totalcmp, memcmp
+
+def compare_full(args):
+    # Parse reference trace
+    streams = NSTREAMS if args.memory else STORE
+    ref = load_trace(args.spike, parse_spike, args.jobs, args.cache)
+    print_count("reference", ref.count_streams(), args.memory)
+    if args.mmap and not ref.mapped:
+        ref = ref.spill()
+
+    # Parse risu trace
+    act = load_trace(args.risu, parse_risu, args.jobs, args.cache)
+    print_count("actual", act.count_streams(), args.memory)
+    if args.mmap and not act.mapped:
+        act = act.spill()
+
+    if not args.resync:
+        counts = compare_stores(ref, act, print_report, streams)
+        print_compared("Done", counts, args.memory)
+        return
+
+    comparator = Comparator(print_report, args.converge_limit)
+    ref_index = ref.register_index()
+    act_index = act.register_index()
+    # Compare register writeback
+    for r in range(1, streams):
+        comparator.drain(r, deque(ref.events(ref_index[r])),
+                deque(act.events(act_index[r])), True, True)
+
+    comparator.summary()
+    print_compared("Done", (comparator.totalcmp, comparator.memcmp),
+            args.memory)
+
+class TraceStream:
+    """One side of a streaming comparison"""
+
+    def __init__(self, name, events, history=0):
+        self.name = name
+        self.events = events
+        self.queues = [deque() for i in range(NSTREAMS)]
+        # Recent instructions, kept for --first-divergence context
+        self.history = deque(maxlen=history) if history else None
+        self.progress = 0
+        self.count = 0
+        self.accesses = 0
+        self.dropped = 0
+        self.done = False
+
+    def next(self):
+        try:
+            event = next(self.events)
+        except StopIteration:
+            self.done = True
+            return None
+        if event[0] >= STORE:
+            self.accesses = self.accesses + 1
+        else:
+            self.progress = self.progress + 1
+            if event[0] >= 0:
+                self.count = self.count + 1
+        if self.history is not None:
+            self.history.append(event)
+        return event
+
+    def oldest_pending(self):
+        """Line number of the oldest unmatched writeback"""
+        heads = [q[0][0] for q in self.queues if q]
+        return min(heads) if heads else None
+
+def compare_stream(args):
+    """
+    Compare both traces while reading them. The stream that is behind (in
+    number of instructions) is read next, each writeback is matched against
+    the oldest pending writeback of the same register from the other trace.
+    Only unmatched writebacks are kept, so memory depends on how far the two
+    traces drift apart, not on their length.
+
+    With --first-divergence, the comparison stops at the mismatch that is
+    earliest in program order (reference line order). A mismatch found
+    while older reference writebacks are still unmatched is only a
+    candidate, reading goes on until those are resolved or the reference
+    is queue_limit instructions further.
+    """
+    first = args.first_divergence
+    streams = NSTREAMS if args.memory else STORE
+    history = 0
+    if first:
+        history = 2 * args.context + args.queue_limit + 1
+    slog = open_trace(args.spike)
+    rlog = open_trace(args.risu)
+    ref = TraceStream("REF", parse_spike(slog), history)
+    act = TraceStream("ACTUAL", parse_risu(rlog), history)
+    # First divergence candidate: (ref line, act line, report, ref progress,
+    # act progress)
+    candidate = None
+
+    def report(ref_lineno, act_lineno, text):
+        nonlocal candidate
+        if not first:
+            print(text)
+        elif (candidate is None) or (ref_lineno < candidate[0]):
+            candidate = (ref_lineno, act_lineno, text,
+                    ref.progress, act.progress)
+
+    comparator = Comparator(report, args.converge_limit if args.resync else 0)
+    while (not ref.done) or (not act.done):
+        if candidate is not None:
+            ref_lineno, _, _, ref_progress, act_progress = candidate
+            oldest = ref.oldest_pending()
+            resolved = act.done or (oldest is None) or (oldest > ref_lineno) or \
+                    (ref.progress - ref_progress > args.queue_limit)
+            if resolved and \
+                    (ref.done or (ref.progress >= ref_progress + args.context)) and \
+                    (act.done or (act.progress >= act_progress + args.context)):
+                break
+        if (not ref.done) and (act.done or (ref.progress <= act.progress)):
+            this, other = ref, act
+        else:
+            this, other = act, ref
+        event = this.next()
+        if event is None:
+            # Entries waiting for a resync look ahead can be decided now
+            for r in range(1, streams):
+                comparator.drain(r, ref.queues[r], act.queues[r],
+                        ref.done, act.done)
+            continue
+        if (event[0] <= 0) or (event[0] >= streams):
+            continue
+        rdst = event[0]
+        if other.done and not other.queues[rdst]:
+            continue
+        queue = this.queues[rdst]
+        queue.append(event[1:])
+        comparator.drain(rdst, ref.queues[rdst], act.queues[rdst],
+                ref.done, act.done)
+        if len(queue) > args.queue_limit:
+            lineno = queue.popleft()[0]
+            this.dropped = this.dropped + 1
+            print("Line", lineno, "(" + this.name + ")",
+                    "dropped,", stream_name(rdst), "is more than",
+                    args.queue_limit, "entries ahead")
+    slog.close()
+    rlog.close()
+
+    if candidate is not None:
+        print("First divergence:")
+        print(candidate[2])
+        print_context(ref, candidate[0], args.context)
+        print_context(act, candidate[1], args.context)
+        print_compared("Stopped", (comparator.totalcmp, comparator.memcmp),
+                args.memory)
+        return
+
+    print_count("reference", (ref.count, ref.accesses), args.memory)
+    print_count("actual", (act.count, act.accesses), args.memory)
+    if ref.dropped or act.dropped:
+        print(ref.dropped + act.dropped, "writeback entry dropped.")
+    comparator.summary()
+    print_compared("Done", (comparator.totalcmp, comparator.memcmp),
+            args.memory)
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Compare trace generated by RISu and Spike")
+    parser.add_argument("--risu", "-r", required=True,
+            help="Trace log generated by RISu simulator, - for stdin")
+    parser.add_argument("--spike", "-s", required=True,
+            help="Trace log generated by Spike, - for stdin")
+    parser.add_argument("--stream", action="store_true",
+            help="Compare while reading, report mismatches as found")
+    parser.add_argument("--queue-limit", type=int, default=queue_limit,
+            help="Maximum pending writebacks per register in stream mode")
+    parser.add_argument("--first-divergence", action="store_true",
+            help="Stop at the earliest mismatch, implies --stream")
+    parser.add_argument("--context", "-n", type=int, default=10,
+            help="Retired instructions shown around the first divergence")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+            help="Parse each log in this many shards on a process pool")
+    parser.add_argument("--mmap", action="store_true",
+            help="Keep parsed traces in memory mapped temporary files")
+    parser.add_argument("--no-cache", dest="cache", action="store_false",
+            help="Don't read or write the parsed .rtrace sidecar files")
+    parser.add_argument("--resync", action="store_true",
+            help="Resynchronize after extra or missing writebacks")
+    parser.add_argument("--converge-limit", type=int, default=converge_limit,
+            help="Writebacks to look ahead when resynchronizing")
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+            help="Don't compare store and load addresses")
+    args = parser.parse_args()
+
+    if args.stream or args.first_divergence:
+        compare_stream(args)
+    else:
+        compare_full(args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,135 @@
+#
+# RISu64
+# Copyright 2022 Wenting Zhang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Trace log input for trace_comparater.py: plain, gzip, xz or zstd files,
+# or "-" for stdin. Compressed input is decompressed by a background thread
+# while the caller parses, nothing is written to disk.
+import gzip
+import io
+import lzma
+import queue
+import subprocess
+import sys
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FORMATS = ((b"\x1f\x8b", "gzip"), (b"\xfd7zXZ\x00", "xz"),
+        (b"\x28\xb5\x2f\xfd", "zstd"))
+
+# Decompressed blocks handed to the parser, and how many can be queued
+BLOCK_SIZE = 1 << 20
+QUEUE_DEPTH = 16
+
+def detect_format(f):
+    """Returns the compression of buffered binary stream f, or None"""
+    head = f.peek(8)[:8]
+    for magic, fmt in FORMATS:
+        if head.startswith(magic):
+            return fmt
+    return None
+
+def is_plain_file(fn):
+    """Whether fn is an uncompressed regular file, which can be sharded"""
+    if fn == "-":
+        return False
+    with open(fn, "rb") as f:
+        return detect_format(f) is None
+
+def decompress(f, fmt):
+    """Returns a binary file object reading the decompressed data of f"""
+    if fmt == "gzip":
+        return gzip.GzipFile(fileobj=f)
+    elif fmt == "xz":
+        return lzma.LZMAFile(f)
+    if zstandard is not None:
+        return zstandard.ZstdDecompressor().stream_reader(f)
+    # No python binding, fall back to the zstd command. f is fed through a
+    # pipe since its buffer already holds the peeked header.
+    proc = subprocess.Popen(["zstd", "-dc"], stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE)
+    threading.Thread(target=copy_stream, args=(f, proc.stdin),
+            daemon=True).start()
+    return proc.stdout
+
+def copy_stream(src, dst):
+    try:
+        with src, dst:
+            while True:
+                block = src.read(BLOCK_SIZE)
+                if not block:
+                    break
+                dst.write(block)
+    except BrokenPipeError:
+        pass
+
+class QueueReader(io.RawIOBase):
+    """Raw stream over blocks put in a queue, an empty block is EOF"""
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.pending = b""
+        self.eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self.pending and not self.eof:
+            block = self.blocks.get()
+            if isinstance(block, Exception):
+                raise block
+            self.pending = block
+            self.eof = not block
+        n = min(len(b), len(self.pending))
+        b[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+def read_blocks(f, blocks):
+    try:
+        with f:
+            while True:
+                block = f.read(BLOCK_SIZE)
+                blocks.put(block)
+                if not block:
+                    break
+    except Exception as err:
+        blocks.put(err)
+
+def open_trace(fn):
+    """Opens trace log fn for reading text lines, fn "-" is stdin"""
+    if fn == "-":
+        raw = sys.stdin.buffer
+    else:
+        raw = open(fn, "rb")
+    fmt = detect_format(raw)
+    if fmt is None:
+        return io.TextIOWrapper(raw, errors="replace")
+    blocks = queue.Queue(QUEUE_DEPTH)
+    threading.Thread(target=read_blocks, args=(decompress(raw, fmt), blocks),
+            daemon=True).start()
+    return io.TextIOWrapper(io.BufferedReader(QueueReader(blocks),
+            BLOCK_SIZE), errors="replace")
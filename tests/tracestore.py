@@ -0,0 +1,243 @@
+#
+# RISu64
+# Copyright 2022 Wenting Zhang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Column store for parsed trace events, used by trace_comparater.py
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Column name, array typecode. Line numbers are uint32, register uint8.
+COLUMNS = (("pc", "Q"), ("value", "Q"), ("addr", "Q"), ("lineno", "I"),
+        ("reg", "B"))
+DTYPES = {"Q": "uint64", "I": "uint32", "B": "uint8"}
+
+# Streams after the 32 registers: store address and data, load address
+STORE = 32
+LOAD = 33
+NSTREAMS = 34
+
+MAGIC = b"RTRACE\x00\x02"
+# Magic, number of events
+HEADER = struct.Struct("<8sQ")
+
+# Sidecar cache header: magic, parser name, log size, log mtime, log sha256.
+# The store follows right after it.
+CACHE_MAGIC = b"RTCACHE\x01"
+CACHE_HEADER = struct.Struct("<8s16sQQ32s")
+CACHE_SUFFIX = ".rtrace"
+
+assert array("I").itemsize == 4
+
+def _align(n):
+    return (n + 7) & ~7
+
+class TraceStore:
+    """
+    Trace events kept in typed columns instead of tuples of strings, about
+    29 bytes per event. Columns are array.array while building, or
+    memoryviews into a mmap'd file once loaded. Both expose the buffer
+    protocol so numpy (if installed) can compare them without copying.
+    Retired instructions without writeback are stored with reg 0, memory
+    accesses with reg STORE or LOAD and their address in addr.
+    """
+
+    def __init__(self):
+        self.pc = array("Q")
+        self.value = array("Q")
+        self.addr = array("Q")
+        self.lineno = array("I")
+        self.reg = array("B")
+        self._mmap = None
+
+    def __len__(self):
+        return len(self.reg)
+
+    @property
+    def mapped(self):
+        return self._mmap is not None
+
+    def append(self, reg, lineno, pc, value, addr=0):
+        self.reg.append(reg)
+        self.lineno.append(lineno)
+        self.pc.append(pc)
+        self.value.append(value)
+        self.addr.append(addr)
+
+    def extend(self, other):
+        for name, _ in COLUMNS:
+            getattr(self, name).extend(getattr(other, name))
+
+    def count(self, reg):
+        if numpy is not None:
+            return int(numpy.count_nonzero(self.column("reg") == reg))
+        return sum(1 for r in self.reg if r == reg)
+
+    def count_streams(self):
+        """Returns the number of (instruction, memory access) events"""
+        accesses = self.count(STORE) + self.count(LOAD)
+        return len(self) - accesses, accesses
+
+    def column(self, name):
+        """Returns a column as numpy array, only when numpy is available"""
+        return numpy.frombuffer(getattr(self, name),
+                dtype=DTYPES[dict(COLUMNS)[name]])
+
+    def register_index(self):
+        """Returns the event indices of each stream, in trace order"""
+        if numpy is not None:
+            reg = self.column("reg")
+            order = numpy.argsort(reg, kind="stable")
+            bounds = numpy.searchsorted(reg[order], numpy.arange(NSTREAMS + 1))
+            return [order[bounds[r]:bounds[r + 1]] for r in range(NSTREAMS)]
+        index = [array("Q") for r in range(NSTREAMS)]
+        for i, r in enumerate(self.reg):
+            index[r].append(i)
+        return index
+
+    def events(self, indices):
+        """
+        Yields (lineno, pc, value) of the given events as hex strings, value
+        is (address, data) for stores and (address,) for loads
+        """
+        for i in indices:
+            reg = self.reg[i]
+            if reg == STORE:
+                value = ("%016x" % self.addr[i], "%016x" % self.value[i])
+            elif reg == LOAD:
+                value = ("%016x" % self.addr[i],)
+            else:
+                value = "%016x" % self.value[i]
+            yield (self.lineno[i], "%016x" % self.pc[i], value)
+
+    def write(self, f):
+        """Writes the store to a binary file object"""
+        f.write(HEADER.pack(MAGIC, len(self)))
+        for name, _ in COLUMNS:
+            data = bytes(getattr(self, name))
+            f.write(data)
+            f.write(b"\x00" * (_align(len(data)) - len(data)))
+
+    @staticmethod
+    def load(f, offset=0):
+        """
+        Maps a store written by write(), starting at offset in the file.
+        The columns are views into the mapping, nothing is copied.
+        """
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n = HEADER.unpack_from(mm, offset)
+        if magic != MAGIC:
+            mm.close()
+            raise ValueError("not a trace store")
+        store = TraceStore()
+        store._mmap = mm
+        view = memoryview(mm)
+        pos = offset + HEADER.size
+        for name, typecode in COLUMNS:
+            size = n * array(typecode).itemsize
+            setattr(store, name, view[pos:pos + size].cast(typecode))
+            pos = pos + _align(size)
+        return store
+
+    def spill(self):
+        """
+        Moves the columns to an anonymous temporary file and maps it, so
+        the store is backed by the page cache instead of process memory.
+        """
+        f = tempfile.TemporaryFile()
+        self.write(f)
+        f.flush()
+        return TraceStore.load(f)
+
+def hash_file(fn):
+    h = hashlib.sha256()
+    with open(fn, "rb") as f:
+        while True:
+            block = f.read(1 << 24)
+            if not block:
+                break
+            h.update(block)
+    return h.digest()
+
+def cache_path(fn):
+    return fn + CACHE_SUFFIX
+
+def load_cache(fn, kind):
+    """
+    Returns the cached store of log fn parsed by parser kind, or None if
+    there is no valid cache. The cache is used as is when the size and
+    mtime of the log still match, otherwise the log is hashed and
+    compared against the recorded content hash.
+    """
+    try:
+        f = open(cache_path(fn), "rb")
+    except OSError:
+        return None
+    with f:
+        header = f.read(CACHE_HEADER.size)
+        if len(header) != CACHE_HEADER.size:
+            return None
+        magic, name, size, mtime, digest = CACHE_HEADER.unpack(header)
+        if (magic != CACHE_MAGIC) or (name.rstrip(b"\x00") != kind.encode()):
+            return None
+        st = os.stat(fn)
+        if (st.st_size != size) or (st.st_mtime_ns != mtime):
+            if (st.st_size != size) or (hash_file(fn) != digest):
+                return None
+            # Same content, record the new mtime to skip hashing next time
+            try:
+                with open(cache_path(fn), "r+b") as w:
+                    w.write(CACHE_HEADER.pack(magic, name, size,
+                            st.st_mtime_ns, digest))
+            except OSError:
+                pass
+        try:
+            return TraceStore.load(f, CACHE_HEADER.size)
+        except ValueError:
+            return None
+
+def save_cache(fn, kind, store):
+    """Writes store as the cache of log fn, returns False if not writable"""
+    st = os.stat(fn)
+    header = CACHE_HEADER.pack(CACHE_MAGIC, kind.encode(), st.st_size,
+            st.st_mtime_ns, hash_file(fn))
+    path = cache_path(fn)
+    tmp = "%s.%d" % (path, os.getpid())
+    try:
+        with open(tmp, "wb") as f:
+            f.write(header)
+            store.write(f)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        return False
+    return True
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+#
+# RISu64
+# Copyright 2022 Wenting Zhang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Generate rtl/genrtl in parallel, equivalent to running make in rtl/
+import argparse
+import concurrent.futures
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import pyhp
+import pyhpdeps
+
+# Keep in sync with FORMATTER in rtl/Makefile
+FORMATTER = ["verible-verilog-format",
+    "--column_limit", "132", "--indentation_spaces", "4",
+    "--assignment_statement_alignment", "flush-left",
+    "--case_items_alignment", "flush-left",
+    "--class_member_variable_alignment", "flush-left",
+    "--distribution_items_alignment", "flush-left",
+    "--enum_assignment_statement_alignment", "flush-left",
+    "--formal_parameters_alignment", "flush-left",
+    "--module_net_variable_alignment", "flush-left",
+    "--named_parameter_alignment", "flush-left",
+    "--named_port_alignment", "flush-left",
+    "--port_declarations_alignment", "flush-left",
+    "--struct_union_members_alignment", "flush-left",
+    "--try_wrap_long_lines=true",
+    "--failsafe_success=true",
+    "--inplace=true"]
+
+OUT_DIR = "genrtl"
+DEPS = os.path.join(OUT_DIR, ".genrtl.deps.json")
+
+def find_sources(root):
+    """returns (pyv files, v/vh files) relative to root, skipping genrtl"""
+    pyv = []
+    verilog = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel = os.path.relpath(dirpath, root)
+        if rel == OUT_DIR:
+            dirnames[:] = []
+            continue
+        dirnames[:] = [d for d in dirnames if d != "__pycache__"]
+        for fn in filenames:
+            path = os.path.normpath(os.path.join(rel, fn))
+            if fn.endswith(".pyv"):
+                pyv.append(path)
+            elif fn.endswith(".v") or fn.endswith(".vh"):
+                verilog.append(path)
+    return sorted(pyv), sorted(verilog)
+
+def format_file(formatter, fn):
+    if formatter is None:
+        return
+    subprocess.run(formatter + [fn], check=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+_deps = None
+
+def worker_init(root, symbol_modules):
+    global _deps
+    os.chdir(root)
+    sys.path.insert(0, "pylib")
+    _deps = pyhpdeps.DepTracker(symbol_modules)
+
+def worker_expand(infile, outfile, formatter, digest):
+    """
+    expands and formats one template, runs in the pool.  digest is the raw
+    output digest from the manifest, the formatted file is kept if the
+    expansion still matches it.
+    """
+    start = time.perf_counter()
+    _deps.begin()
+    try:
+        data = pyhp.expand(infile, deps=_deps)
+    finally:
+        entry = _deps.end()
+    entry["input"] = infile
+    entry["output"] = pyhp.output_digest(data)
+    updated = pyhp.update_file(outfile, data, digest)
+    expanded = time.perf_counter()
+    if updated:
+        format_file(formatter, outfile)
+    return entry, expanded - start, time.perf_counter() - expanded
+
+def copy_file(infile, outfile):
+    """copies infile unless outfile is already identical, returns True if copied"""
+    try:
+        si = os.stat(infile)
+        so = os.stat(outfile)
+        if (si.st_size == so.st_size) and (si.st_mtime <= so.st_mtime):
+            return False
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(outfile), exist_ok=True)
+    shutil.copy2(infile, outfile)
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Generate RTL sources into genrtl in parallel")
+    parser.add_argument("--rtl", default=os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "..", "rtl"),
+            help="RTL source directory")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count(),
+            help="Number of worker processes")
+    parser.add_argument("--force", "-f", action="store_true",
+            help="Regenerate every template, ignore the dependency manifest")
+    parser.add_argument("--no-format", action="store_true",
+            help="Don't run the formatter")
+    parser.add_argument("--symbol-modules",
+            default=",".join(pyhpdeps.DEFAULT_SYMBOL_MODULES),
+            help="Modules tracked per symbol instead of per file")
+    args = parser.parse_args()
+
+    wall_start = time.perf_counter()
+    root = os.path.abspath(args.rtl)
+    os.chdir(root)
+    sys.path.insert(0, "pylib")
+    symbol_modules = args.symbol_modules.split(",")
+
+    formatter = None
+    if not args.no_format:
+        if shutil.which(FORMATTER[0]):
+            formatter = FORMATTER
+        else:
+            print(f"{FORMATTER[0]} not found, output won't be formatted.")
+
+    pyv, verilog = find_sources(".")
+    manifest = {} if args.force else pyhpdeps.load_manifest(DEPS)
+    checker = pyhpdeps.DepTracker(symbol_modules)
+    todo = []
+    for infile in pyv:
+        outfile = os.path.join(OUT_DIR, infile[:-len(".pyv")] + ".v")
+        entry = manifest.get(outfile)
+        digest = None
+        if entry and (entry.get("input") == infile):
+            if os.path.exists(outfile) and checker.is_current(entry):
+                continue
+            digest = entry.get("output")
+        manifest.pop(outfile, None)
+        todo.append((infile, outfile, digest))
+    checker.close()
+    uptodate = len(pyv) - len(todo)
+
+    failed = 0
+    copied = 0
+    busy = 0.0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs,
+            initializer=worker_init,
+            initargs=(root, symbol_modules)) as pool:
+        futures = {}
+        for infile, outfile, digest in todo:
+            future = pool.submit(worker_expand, infile, outfile, formatter,
+                    digest)
+            futures[future] = (infile, outfile)
+
+        # Plain files are copied while the pool is busy
+        for fn in verilog:
+            if copy_file(fn, os.path.join(OUT_DIR, fn)):
+                copied = copied + 1
+
+        for future in concurrent.futures.as_completed(futures):
+            infile, outfile = futures[future]
+            try:
+                entry, t_expand, t_format = future.result()
+            except Exception as err:
+                print(f"FAILED {infile}: {type(err).__name__}: {err}")
+                failed = failed + 1
+                continue
+            manifest[outfile] = entry
+            busy = busy + t_expand + t_format
+            print(f"{t_expand * 1000:8.1f} ms expand {t_format * 1000:8.1f} ms format  {infile} -> {outfile}")
+
+    pyhpdeps.save_manifest(DEPS, manifest)
+
+    wall = time.perf_counter() - wall_start
+    print(f"Generated {len(todo) - failed}, up to date {uptodate}, "
+            f"failed {failed}, copied {copied} of {len(verilog)} V/VH files.")
+    print(f"Wall time {wall * 1000:.1f} ms, worker time {busy * 1000:.1f} ms "
+            f"on {args.jobs} jobs.")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -20,29 +20,75 @@
 """Parses PyHP documents
 """
 
-from collections import UserString
+import argparse
 import code
+import hashlib
+import importlib.util
+import marshal
+import os
+import pyhpdeps
 import sys
 import re
 
 __version__ = "$Id: pyhp.py,v 1.12 2000/11/10 17:26:33 ccraig Exp $"
 
-class fbuffer(UserString):
+class fbuffer:
     """Acts sort of like an mmap'ed file with out the file.
-    Allows the use of a string object as sys.stdout
+    Allows the use of a string object as sys.stdout.  Writes are kept as a
+    list of chunks and only joined once, when the text is asked for.
     """
     def __init__(self):
-        UserString.__init__(self, '')
+        self.chunks = []
 
     def write(self, str):
-        self.data += str
+        self.chunks.append(str)
+
+    def flush(self):
+        pass
+
+    def clear(self):
+        self.chunks = []
+
+    def getvalue(self):
+        if len(self.chunks) > 1:
+            self.chunks = [''.join(self.chunks)]
+        return self.chunks[0] if self.chunks else ''
+
+    def __str__(self):
+        return self.getvalue()
+
+
+class fstream:
+    """Passes writes straight through to a file object, so memory use does
+    not grow with the size of the page.
+    """
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, str):
+        self.file.write(str)
+
+    def flush(self):
+        self.file.flush()
+
+    def clear(self):
+        self.file.seek(0)
+        self.file.truncate()
 
 
 class PageData:
     """Allows the modification of body and headers on the fly"""
 
-    def __init__(self):
-        self._body = fbuffer()
+    def __init__(self, cache=True, cache_dir=None, out=None, deps=None):
+        """
+        if out is given, the body is streamed to that file object instead
+        of being collected in memory.  deps is an optional
+        pyhpdeps.DepTracker told about every included file.
+        """
+        self._body = fbuffer() if out is None else fstream(out)
+        self.cache = cache
+        self.cache_dir = cache_dir
+        self.deps = deps
         self._headers = {}
         self.staticvars = {} # for compatibility
 
@@ -61,7 +107,7 @@ class PageData:
         to this point, starting as if no code had been executed and no text
         had been processed.  This is useful for generating error pages.
         """
-        self._body.data = ''
+        self._body.clear()
         self._headers = {}
 
     def _writeout(self):
@@ -75,7 +121,10 @@ class PageData:
         #sys.stdout.write('\r\n\r\n')
 
         # send body to port
-        sys.stdout.write(str(self._body))
+        if isinstance(self._body, fstream):
+            self._body.flush()
+        else:
+            sys.stdout.write(self._body.getvalue())
 
     def include(self, filename):
         """
@@ -83,83 +132,42 @@ class PageData:
         This takes place in a fresh namespace and does not inherit variables
         from the current namespace.  Text and headers generated by the PyHP
         file are inserted at the present place in the document body and
-        headers respectively.  This procedure is at least an order of
-        magnitude slower than a python 'import' statement, so should be used
-        sparingly
+        headers respectively.  The file is compiled once and the result is
+        cached on disk, see load_template()
         """
-        file = open(filename)
-
         cgienv = {'pyhp': self,
                   'sys':  sys}
         interp = PyHPInterp(cgienv)
 
-        # read in file
-        try:
-            file.seek(0,0)
-            data = file.read()
-            if data[0] == '#': # detect shell script syntax
-                data = data.split('\n', 1)[1]
-        except IOError:
-            raise apache.SERVER_RETURN(apache.HTTP_INTERNAL_SERVER_ERROR)
-
-        # split file into sections
-        fields = reg.split(data)
-        fields = [x for x in fields if len(x)!=0]
-
-        # setup data and parse code
-        lineCnt = 1
-        for f in fields:
-            # strip out right white space to have indented %> possible
-            forig = f
-            f = f[:-2]
-            f = f.rstrip(" ");
-            if f[:3] == '<%=': interp.pushvar(f[4:])
-            # if f[:3] == '<%=': interp.pushvar(f[4:-2])
-            elif f[:3] == '<%-': pass
-            # elif f[:2] == '<%': interp.pushcode(f[3:-2])
-            elif f[:2] == '<%': interp.pushcode(f[3:], filename, lineCnt)
-            else: interp.pushtext(forig)
-            # count lines for accurate error reporting in pushcode() below
-            tmp = forig.split('\n')
-            lineCnt += len(tmp)-1
+        template = load_template(filename, self.cache, self.cache_dir)
+        if self.deps is not None:
+            self.deps.add_template(filename, template)
+        interp.runtemplate(template)
+
+
+class TemplateError(Exception):
+    """raised once an error in a template has been reported on stderr"""
 
 
 class PyHPInterp(code.InteractiveInterpreter):
     """Interpreter for PyHP.  Allows mod_python to spawn a seperate
     pseudo interpreter for each script run with its own namespace, but still
-    cache module loads"""
+    cache module loads.  Errors are printed like the interactive interpreter
+    does, then expansion stops with a TemplateError."""
 
-    def pushcode(self, codeobj, filename, lineCnt):
-        # so.write("PYTHON CODE\n")
-        lines = codeobj.split("\n")
-        # for line in lines:
-        #     so.write("line\n")
-        #     so.write(line)
-        #     so.write("\n")
-        # get the indentation of the first line
-        ws = re.compile("^(\s*)(.*)")
-        match = ws.match(lines[0])
-        ws = match.group(1)
-        nws = match.group(2)
-        if (len(nws) == 0):
-            wslen = 0
-        else:
-            wslen = len(ws)
-        codeobj = ""
-        # so.write("NUMINDENTATION is " + `wslen` + '\n')
-        for line in lines:
-            # so.write("indented line\n")
-            # so.write(line[wslen:])
-            # so.write("\n");
-            line = line[wslen:]
-            codeobj += line + "\n"
-        # codeobj = "".join(lines)
-        try:
-            c = code.compile_command(codeobj, '<string>', 'exec')
-            self.runcode(c)
+    def showtraceback(self):
+        # an included template already reported its own error
+        if not isinstance(sys.exc_info()[1], TemplateError):
+            code.InteractiveInterpreter.showtraceback(self)
+        raise TemplateError("exception while running template")
 
-        except Exception as err:
-            raise type(err)(str(err) + " in code segment starting on line " + str(lineCnt) + ' in pyv file ' + filename)
+    def showsyntaxerror(self, *args, **kwargs):
+        code.InteractiveInterpreter.showsyntaxerror(self, *args, **kwargs)
+        raise TemplateError("syntax error in template")
+
+    def pushcode(self, codeobj, filename, lineCnt):
+        c = compile_code(codeobj, filename, lineCnt)
+        self.runcode(c)
 
     def pushvar(self, var):
         cmd = 'sys.stdout.write(str(%s))' % var
@@ -168,17 +176,340 @@ class PyHPInterp(code.InteractiveInterpreter):
     def pushtext(self, text):
         self.locals['sys'].stdout.write(text)
 
+    def runtemplate(self, template):
+        """runs the segments produced by compile_template()"""
+        for kind, payload in template:
+            if kind == SEG_TEXT:
+                self.pushtext(payload)
+            elif kind == SEG_CODE:
+                self.runcode(payload)
+            elif isinstance(payload, str):
+                # expression failed to compile, let runsource report it
+                self.runsource(payload)
+            elif payload is not None:
+                self.runcode(payload)
+
+
+def dedent_code(codeobj):
+    """strips the indentation of the first line from every line"""
+    lines = codeobj.split("\n")
+    # get the indentation of the first line
+    match = ws.match(lines[0])
+    if (len(match.group(2)) == 0):
+        wslen = 0
+    else:
+        wslen = len(match.group(1))
+    return "".join(line[wslen:] + "\n" for line in lines)
+
+
+def compile_code(codeobj, filename, lineCnt):
+    """compiles a <% %> segment, errors carry the segment position"""
+    try:
+        return code.compile_command(dedent_code(codeobj), '<string>', 'exec')
+    except Exception as err:
+        raise type(err)(str(err) + " in code segment starting on line " + str(lineCnt) + ' in pyv file ' + filename)
+
+
+def compile_var(var):
+    """
+    compiles a <%= %> segment.  Source that does not compile is kept as a
+    string, so it is reported by runsource() at run time like before.
+    """
+    cmd = 'sys.stdout.write(str(%s))' % var
+    try:
+        return code.compile_command(cmd, '<input>', 'single')
+    except (OverflowError, SyntaxError, ValueError):
+        return cmd
+
+
+def compile_template(data, filename):
+    """
+    splits a PyHP document into a tuple of (kind, payload) segments, with
+    text kept verbatim and code already compiled.  The result only holds
+    strings, code objects and tuples, so it can be stored with marshal.
+    """
+    if data[0] == '#': # detect shell script syntax
+        data = data.split('\n', 1)[1]
+
+    # split file into sections
+    fields = reg.split(data)
+    fields = [x for x in fields if len(x)!=0]
+
+    # setup data and parse code
+    segments = []
+    lineCnt = 1
+    for f in fields:
+        # strip out right white space to have indented %> possible
+        forig = f
+        f = f[:-2]
+        f = f.rstrip(" ");
+        if f[:3] == '<%=': segments.append((SEG_VAR, compile_var(f[4:])))
+        elif f[:3] == '<%-': pass
+        elif f[:2] == '<%': segments.append((SEG_CODE, compile_code(f[3:], filename, lineCnt)))
+        else: segments.append((SEG_TEXT, forig))
+        # count lines for accurate error reporting in compile_code()
+        lineCnt += forig.count('\n')
+    return tuple(segments)
+
 
+def cache_path(filename, cache_dir=None):
+    """
+    returns where the compiled form of filename is stored, by default in a
+    __pycache__ folder next to it.  The interpreter tag is part of the name.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(filename), '__pycache__')
+    name = '%s.%s.pyhpc' % (os.path.basename(filename),
+            sys.implementation.cache_tag)
+    return os.path.join(cache_dir, name)
+
+
+def load_template(filename, cache=True, cache_dir=None):
+    """
+    returns the compiled segments of a PyHP file.  The cache file starts
+    with a header holding the interpreter magic number and the SHA-256 of
+    the source, it is only used when both match.  Otherwise the file is
+    compiled again and the cache rewritten.  Failure to write the cache is
+    not an error.
+    """
+    with open(filename) as file:
+        data = file.read()
+    if not cache:
+        return compile_template(data, filename)
+
+    header = CACHE_MAGIC + importlib.util.MAGIC_NUMBER + \
+            hashlib.sha256(data.encode('utf-8', 'surrogateescape')).digest()
+    path = cache_path(filename, cache_dir)
+    try:
+        with open(path, 'rb') as f:
+            blob = f.read()
+        if blob[:len(header)] == header:
+            return marshal.loads(blob[len(header):])
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    template = compile_template(data, filename)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename, parallel make may build the same template
+        tmp = '%s.%d' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(header + marshal.dumps(template))
+        os.replace(tmp, path)
+    except OSError:
+        pass
+    return template
+
+
+SEG_TEXT = 0
+SEG_CODE = 1
+SEG_VAR = 2
+CACHE_MAGIC = b'PYHP\x01\x00'
+
+ws = re.compile(r"^(\s*)(.*)")
 reg = re.compile('(<%.*?%>)', re.S)
-pyhp = PageData()
 
-# setup environment
-so = sys.__stdout__
-sys.stdout = sys.__stdout__ = pyhp._body
 
-# parse code
-pyhp.include(sys.argv[1])
+def expand(filename, cache=True, cache_dir=None, out=None, deps=None):
+    """
+    expands a single PyHP file and returns the generated text.  Each call
+    gets its own PageData and namespace, but modules imported by the
+    template stay cached in sys.modules between calls.  If out is given
+    the text is streamed to that file object and None is returned.
+    """
+    pyhp = PageData(cache, cache_dir, out, deps)
+
+    # setup environment
+    so = sys.stdout
+    sys.stdout = pyhp._body
+    try:
+        pyhp.include(filename)
+    finally:
+        sys.stdout = so
+
+    if out is not None:
+        pyhp._writeout()
+        return None
+    return pyhp._body.getvalue()
+
+
+def output_digest(data):
+    """returns the SHA-256 of expanded text, as kept in the deps manifest"""
+    return hashlib.sha256(data.encode('utf-8', 'surrogateescape')).hexdigest()
+
+
+def update_file(filename, data, digest=None):
+    """
+    writes data to filename, unless the file already holds exactly that
+    content.  Outputs that are formatted in place no longer match the raw
+    expansion, for those digest is the output_digest() of the text last
+    written and the file is left alone while it still matches.
+    Returns True if the file was (re)written.
+    """
+    if digest is not None:
+        if (digest == output_digest(data)) and os.path.exists(filename):
+            return False
+    else:
+        try:
+            with open(filename) as f:
+                if f.read() == data:
+                    return False
+        except IOError:
+            pass
+    dirname = os.path.dirname(filename)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    with open(filename, 'w') as f:
+        f.write(data)
+    return True
+
+
+def read_manifest(filename):
+    """
+    reads a manifest with one 'input output' pair per line.  Blank lines
+    and lines starting with '#' are ignored.
+    """
+    pairs = []
+    with open(filename) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line[0] == '#':
+                continue
+            token = line.split()
+            if len(token) != 2:
+                raise ValueError("bad manifest line: " + line)
+            pairs.append((token[0], token[1]))
+    return pairs
+
+
+def stream_file(infile, outfile, cache=True, cache_dir=None, deps=None):
+    """expands infile straight into outfile, removed again on failure"""
+    dirname = os.path.dirname(outfile)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    try:
+        with open(outfile, 'w') as f:
+            expand(infile, cache, cache_dir, f, deps)
+    except BaseException:
+        os.remove(outfile)
+        raise
+
+
+def batch(pairs, verbose=False, cache=True, cache_dir=None, stream=False,
+        deps=None, manifest=None):
+    """
+    expands every (input, output) pair in this process.  Outputs are only
+    rewritten when their content changes, unless stream is set, in which
+    case they are always written while being expanded.  Names of rewritten
+    outputs are printed to stdout so the caller can post-process them.
+    If deps (a pyhpdeps.DepTracker) and manifest are given, pairs whose
+    recorded dependencies did not change are skipped, and the manifest is
+    updated for the others.  The manifest also keeps the digest of each raw
+    output, so outputs post-processed in place are only rewritten when the
+    expansion really changed.  Returns the number of failed files.
+    """
+    failed = 0
+    for infile, outfile in pairs:
+        digest = None
+        if deps is not None:
+            entry = manifest.get(outfile)
+            if entry and (entry.get("input") == infile):
+                if os.path.exists(outfile) and deps.is_current(entry):
+                    if verbose:
+                        sys.stderr.write("pyhp: %s up to date\n" % outfile)
+                    continue
+                digest = entry.get("output")
+            manifest.pop(outfile, None)
+            deps.begin()
+        try:
+            if stream:
+                stream_file(infile, outfile, cache, cache_dir, deps)
+                data = None
+            else:
+                data = expand(infile, cache, cache_dir, None, deps)
+        except Exception as err:
+            sys.stderr.write("pyhp: %s: %s: %s\n" %
+                    (infile, type(err).__name__, err))
+            failed += 1
+            continue
+        if deps is not None:
+            entry = deps.end()
+            entry["input"] = infile
+            if data is not None:
+                entry["output"] = output_digest(data)
+            manifest[outfile] = entry
+        if data is None:
+            print(outfile)
+        elif update_file(outfile, data, digest):
+            print(outfile)
+        elif verbose:
+            sys.stderr.write("pyhp: %s unchanged\n" % outfile)
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expand PyHP documents")
+    parser.add_argument("--batch", "-b", action="store_true",
+            help="Arguments are input/output pairs, expanded in one process")
+    parser.add_argument("--manifest", "-m",
+            help="File listing 'input output' pairs, one per line")
+    parser.add_argument("--verbose", "-v", action="store_true",
+            help="Report unchanged outputs in batch mode")
+    parser.add_argument("--cache-dir",
+            help="Directory for compiled templates (default: __pycache__)")
+    parser.add_argument("--no-cache", action="store_true",
+            help="Always compile templates, don't read or write the cache")
+    parser.add_argument("--stream", action="store_true",
+            help="Write output while expanding instead of buffering it")
+    parser.add_argument("--deps",
+            help="Dependency manifest, used to skip up to date outputs")
+    parser.add_argument("--depfile",
+            help="Write a make depfile covering every recorded dependency")
+    parser.add_argument("--depfile-target",
+            help="Target of the depfile rule (default: depfile without .d)")
+    parser.add_argument("--symbol-modules",
+            default=",".join(pyhpdeps.DEFAULT_SYMBOL_MODULES),
+            help="Modules tracked per symbol instead of per file")
+    parser.add_argument("files", nargs="*",
+            help="Input file, or input/output pairs with --batch")
+    args = parser.parse_args()
+
+    cache = not args.no_cache
+    if args.batch or args.manifest:
+        if len(args.files) % 2 != 0:
+            parser.error("--batch expects input/output pairs")
+        pairs = list(zip(args.files[0::2], args.files[1::2]))
+        if args.manifest:
+            pairs += read_manifest(args.manifest)
+        deps = None
+        manifest = None
+        if args.deps:
+            deps = pyhpdeps.DepTracker(args.symbol_modules.split(","))
+            manifest = pyhpdeps.load_manifest(args.deps)
+        failed = batch(pairs, args.verbose, cache, args.cache_dir, args.stream,
+                deps, manifest)
+        if args.deps:
+            deps.close()
+            pyhpdeps.save_manifest(args.deps, manifest)
+            if args.depfile:
+                target = args.depfile_target
+                if target is None:
+                    target = os.path.splitext(args.depfile)[0]
+                pyhpdeps.write_depfile(args.depfile, target, manifest)
+        return 1 if failed else 0
+
+    if len(args.files) != 1:
+        parser.error("expected exactly one input file")
+    # write out data
+    try:
+        if args.stream:
+            expand(args.files[0], cache, args.cache_dir, sys.stdout)
+        else:
+            sys.stdout.write(expand(args.files[0], cache, args.cache_dir))
+    except TemplateError:
+        return 1
+    return 0
+
 
-# write out data
-sys.stdout = sys.__stdout__ = so
-pyhp._writeout()
+if __name__ == "__main__":
+    sys.exit(main())
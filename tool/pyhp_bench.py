@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+#
+# RISu64
+# Copyright 2022 Wenting Zhang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Benchmark pyhp output buffering on a large synthetic template
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import UserString
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import pyhp
+
+class legacy_fbuffer(UserString):
+    """The original string concatenating output buffer"""
+    def __init__(self):
+        UserString.__init__(self, '')
+
+    def write(self, str):
+        self.data += str
+
+    def clear(self):
+        self.data = ''
+
+    def getvalue(self):
+        return self.data
+
+def gen_template(fn, lines):
+    # Every block is 8 lines of text followed by a code segment that
+    # prints a few ports, roughly what gen_port/gen_connect produce.
+    with open(fn, "w") as f:
+        count = 0
+        block = 0
+        while count < lines:
+            for i in range(8):
+                f.write(f"    wire [63:0] sig_{block}_{i};\n")
+            f.write("    <% for i in range(4): print(f\"    .port_%d(wire_%d),\" % (i, i)) %>\n")
+            count = count + 9
+            block = block + 1
+
+def run(fn, buffer_class, stream):
+    saved = pyhp.fbuffer
+    pyhp.fbuffer = buffer_class
+    try:
+        start = time.perf_counter()
+        if stream:
+            with open(os.devnull, "w") as f:
+                pyhp.expand(fn, cache=False, out=f)
+            size = 0
+        else:
+            size = len(pyhp.expand(fn, cache=False))
+        return time.perf_counter() - start, size
+    finally:
+        pyhp.fbuffer = saved
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Benchmark pyhp output buffering")
+    parser.add_argument("--lines", "-l", type=int, default=50000,
+            help="Number of lines in the synthetic template")
+    parser.add_argument("--repeat", "-n", type=int, default=3,
+            help="Number of runs, best time is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fn = os.path.join(tmpdir, "bench.pyv")
+        gen_template(fn, args.lines)
+        print(f"Template: {args.lines} lines")
+        cases = [
+            ("legacy fbuffer", legacy_fbuffer, False),
+            ("chunked fbuffer", pyhp.fbuffer, False),
+            ("stream to file", pyhp.fbuffer, True)
+        ]
+        results = []
+        for name, buffer_class, stream in cases:
+            best = min(run(fn, buffer_class, stream)[0]
+                    for i in range(args.repeat))
+            results.append(best)
+            print(f"{name:16s} {best * 1000:10.1f} ms")
+        print(f"Speedup over legacy: {results[0] / results[1]:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+#
+# RISu64
+# Copyright 2022 Wenting Zhang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+"""Dependency tracking for pyhp
+
+While a template is expanded, the tracker records:
+- every PyHP file that went through include(), including the template itself
+- every Python module the template imported, directly or through other
+  modules, found with an __import__ hook
+- the names the template code refers to.  For "symbol modules" (by default
+  risutypes and risuconsts) these are resolved to the module level values,
+  so a template only depends on the structs and constants it uses, not on
+  the whole file.
+
+The result is kept in a JSON manifest next to the generated files, which
+batch mode uses to skip templates whose dependencies did not change, and
+in a make depfile.
+"""
+
+import builtins
+import hashlib
+import importlib
+import json
+import os
+import sys
+import sysconfig
+import types
+
+DEFAULT_SYMBOL_MODULES = ["risutypes", "risuconsts"]
+
+# Values of symbol modules are hashed through repr(), which is only stable
+# for plain data, or for objects that define their own repr (risustruct).
+_DATA_TYPES = (int, float, str, bytes, bool, type(None), list, tuple, dict)
+
+_system_paths = None
+
+def _is_system_file(fn):
+    global _system_paths
+    if _system_paths is None:
+        paths = sysconfig.get_paths()
+        _system_paths = tuple(os.path.abspath(paths[k]) + os.sep
+                for k in ("stdlib", "platstdlib", "purelib", "platlib"))
+    return os.path.abspath(fn).startswith(_system_paths)
+
+def _is_data(value):
+    if isinstance(value, (list, tuple)):
+        return all(_is_data(x) for x in value)
+    if isinstance(value, dict):
+        return all(_is_data(k) and _is_data(v) for k, v in value.items())
+    if isinstance(value, _DATA_TYPES):
+        return True
+    return not callable(value) and \
+            (type(value).__repr__ is not object.__repr__)
+
+def code_names(co):
+    """returns all global/ attribute names referred to by a code object"""
+    names = set(co.co_names)
+    for c in co.co_consts:
+        if isinstance(c, types.CodeType):
+            names |= code_names(c)
+    return names
+
+def hash_symbol(value):
+    return hashlib.sha256(repr(value).encode()).hexdigest()
+
+class DepTracker:
+    """Records what each expanded template depended on"""
+
+    def __init__(self, symbol_modules=None):
+        if symbol_modules is None:
+            symbol_modules = DEFAULT_SYMBOL_MODULES
+        self.symbol_modules = list(symbol_modules)
+        # Module import graph, None is the template being expanded
+        self.edges = {}
+        self.file_hashes = {}
+        self.current = None
+        self._import = builtins.__import__
+        builtins.__import__ = self._hook
+
+    def close(self):
+        builtins.__import__ = self._import
+
+    def _hook(self, name, globals=None, locals=None, fromlist=(), level=0):
+        module = self._import(name, globals, locals, fromlist, level)
+        importer = globals.get("__name__") if globals else None
+        if level == 0 and name in sys.modules:
+            target = name
+        else:
+            target = module.__name__
+        targets = self.edges.setdefault(importer, set())
+        targets.add(target)
+        for f in fromlist or ():
+            sub = target + "." + f
+            if sub in sys.modules:
+                targets.add(sub)
+        if importer is None and self.current is not None:
+            self.current["imports"].add(target)
+        return module
+
+    def begin(self):
+        """starts recording for a new template"""
+        self.current = {"imports": set(), "includes": [], "names": set()}
+
+    def add_template(self, filename, template):
+        """called by PageData.include() for each compiled PyHP file"""
+        if self.current is None:
+            return
+        self.current["includes"].append(filename)
+        for _, payload in template:
+            if isinstance(payload, types.CodeType):
+                self.current["names"] |= code_names(payload)
+
+    def _modules(self, direct):
+        seen = set()
+        todo = list(direct)
+        while todo:
+            name = todo.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            todo.extend(self.edges.get(name, ()))
+        return seen
+
+    def hash_file(self, fn):
+        if fn not in self.file_hashes:
+            try:
+                with open(fn, "rb") as f:
+                    self.file_hashes[fn] = hashlib.sha256(f.read()).hexdigest()
+            except OSError:
+                self.file_hashes[fn] = None
+        return self.file_hashes[fn]
+
+    def end(self):
+        """
+        finishes recording and returns the manifest entry for the template
+        """
+        current = self.current
+        self.current = None
+        files = {}
+        symbols = {}
+        symbol_files = set()
+        modules = []
+        for fn in current["includes"]:
+            files[fn] = self.hash_file(fn)
+        for name in sorted(self._modules(current["imports"])):
+            module = sys.modules.get(name)
+            fn = getattr(module, "__file__", None)
+            if (fn is None) or _is_system_file(fn):
+                continue
+            modules.append(name)
+            fn = os.path.relpath(fn)
+            if name not in self.symbol_modules:
+                files[fn] = self.hash_file(fn)
+                continue
+            symbol_files.add(fn)
+            for sym in sorted(current["names"]):
+                if sym.startswith("_") or not hasattr(module, sym):
+                    continue
+                value = getattr(module, sym)
+                if isinstance(value, types.ModuleType):
+                    continue
+                if not _is_data(value):
+                    # Can't track code by value, depend on the whole file
+                    files[fn] = self.hash_file(fn)
+                    continue
+                symbols[name + "." + sym] = hash_symbol(value)
+        return {"modules": modules,
+                "files": files,
+                "symbol_files": sorted(symbol_files),
+                "symbols": symbols}
+
+    def is_current(self, entry):
+        """checks whether nothing recorded in a manifest entry changed"""
+        for fn, digest in entry["files"].items():
+            if self.hash_file(fn) != digest:
+                return False
+        for sym, digest in entry["symbols"].items():
+            name, attr = sym.rsplit(".", 1)
+            try:
+                module = importlib.import_module(name)
+            except ImportError:
+                return False
+            if not hasattr(module, attr):
+                return False
+            if hash_symbol(getattr(module, attr)) != digest:
+                return False
+        return True
+
+def load_manifest(fn):
+    try:
+        with open(fn) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(fn, manifest):
+    dirname = os.path.dirname(fn)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    tmp = "%s.%d" % (fn, os.getpid())
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, fn)
+
+def write_depfile(fn, target, manifest):
+    """
+    writes a make rule making target depend on every file recorded in the
+    manifest, plus empty rules so deleted files don't break the build.
+    Symbol modules are listed as well, pyhp then decides per template
+    whether the symbols it used really changed.
+    """
+    deps = set()
+    for entry in manifest.values():
+        deps.update(entry["files"].keys())
+        deps.update(entry["symbol_files"])
+    deps = sorted(deps)
+    with open(fn, "w") as f:
+        f.write(target + ":")
+        for dep in deps:
+            f.write(" \\\n  " + dep)
+        f.write("\n")
+        for dep in deps:
+            f.write("\n" + dep + ":\n")